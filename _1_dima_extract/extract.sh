@@ -66,36 +66,94 @@ tables=('tblPlots'
 output_dir="/extracted"
 mkdir -p "$output_dir"
 
-# Loop over each .mdb file in the /dimas directory
-for mdb_file in /dimas/*.mdb; do
+# Number of tables exported at the same time (across all .mdb files)
+jobs="${EXTRACT_JOBS:-$(nproc)}"
+
+# Drop repeated table names so two jobs never write the same CSV
+mapfile -t tables < <(printf '%s\n' "${tables[@]}" | awk '!seen[$0]++')
+
+# One line per exported table: mdb file, table, milliseconds, rows, status
+timing_log=$(mktemp)
+export output_dir timing_log
+
+now_ms() {
+    echo $(( $(date +%s%N) / 1000000 ))
+}
+export -f now_ms
+
+# Export one table once, counting rows from the written file instead of a second export
+extract_table() {
+    local mdb_file="$1"
+    local table="$2"
+
     # Extract the base filename without the path and extension, and replace spaces with underscores
+    local base_filename
     base_filename=$(basename "$mdb_file" .mdb)
     base_filename="${base_filename// /}"
     base_filename="${base_filename//_/\-}"
 
-    # Loop over each table in the list
+    local cleaned_table_name
+    cleaned_table_name=$(echo "$table" | tr -d '_') # Remove spaces in tablenames
+
+    # Construct the output CSV filename
+    local csv_filename="${output_dir}/${base_filename}_${cleaned_table_name}.csv"
+    local partial_filename="${csv_filename}.part"
+
+    local start
+    start=$(now_ms)
+    mdb-export "$mdb_file" "$table" > "$partial_filename"
+    local status=$?
+
+    # Number of lines written, header row included
+    local row_count
+    row_count=$(wc -l < "$partial_filename")
+    local elapsed=$(( $(now_ms) - start ))
+
+    # Ensure at least one data row exists (header row doesn't count)
+    if [ "$row_count" -gt 1 ] && [ $status -eq 0 ]; then
+        mv "$partial_filename" "$csv_filename"
+        echo "Extracted $table from $mdb_file to $csv_filename ($((row_count - 1)) rows, ${elapsed} ms)"
+        status="ok"
+    elif [ "$row_count" -gt 1 ]; then
+        rm -f "$partial_filename"
+        echo "Failed to extract $table from $mdb_file"
+        status="failed"
+    else
+        rm -f "$partial_filename"
+        echo "Skipping $table from $mdb_file as it has no data rows."
+        status="empty"
+    fi
+
+    printf '%s\t%s\t%s\t%s\t%s\n' "$mdb_file" "$table" "$elapsed" "$(( row_count > 0 ? row_count - 1 : 0 ))" "$status" >> "$timing_log"
+}
+export -f extract_table
+
+extract_start=$(now_ms)
+
+# .mdb files to extract: the script arguments (one shard), or every file in /dimas
+if [ "$#" -gt 0 ]; then
+    mdb_files=("$@")
+else
+    mdb_files=(/dimas/*.mdb)
+fi
+
+# Queue every (.mdb file, table) pair and run them $jobs at a time
+for mdb_file in "${mdb_files[@]}"; do
+    [ -e "$mdb_file" ] || continue
     for table in "${tables[@]}"; do
-        cleaned_table_name=$(echo "$table" | tr -d '_') # Remove spaces in tablenames
-
-        # Check the number of rows in the table (excluding headers)
-        row_count=$(mdb-export "$mdb_file" "$table" | wc -l)
-
-        # Ensure at least one data row exists (header row doesn't count)
-        if [ "$row_count" -gt 1 ]; then
-            # Construct the output CSV filename
-            csv_filename="${output_dir}/${base_filename}_${cleaned_table_name}.csv"
-
-            # Export the table to the CSV file
-            mdb-export "$mdb_file" "$table" > "$csv_filename"
-
-            # Check if the extraction was successful
-            if [ $? -eq 0 ]; then
-                echo "Extracted $table from $mdb_file to $csv_filename"
-            else
-                echo "Failed to extract $table from $mdb_file"
-            fi
-        else
-            echo "Skipping $table from $mdb_file as it has no data rows."
-        fi
+        printf '%s\0%s\0' "$mdb_file" "$table"
     done
-done
+done | xargs -0 -n 2 -P "$jobs" bash -c 'extract_table "$1" "$2"' _
+
+# Per-file timing summary (milliseconds are summed across that file's tables)
+echo "Extraction finished in $(( $(now_ms) - extract_start )) ms with $jobs parallel jobs"
+awk -F '\t' '
+    { ms[$1] += $3; rows[$1] += $4; if ($5 == "ok") tables[$1]++; if ($5 == "failed") failed++ }
+    END {
+        for (f in ms) printf "%s: %d tables, %d rows, %d ms\n", f, tables[f], rows[f], ms[f]
+        exit (failed > 0)
+    }
+' "$timing_log"
+status=$?
+rm -f "$timing_log"
+exit $status
@@ -0,0 +1,127 @@
+import logging
+import os, os.path
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+"""
+Host extraction backend: runs mdbtools directly through a subprocess pool,
+without building or starting the Docker extractor. Output files use the same
+`<source>_<table>.csv` naming as extract.sh so classify_table works unchanged.
+"""
+
+EXTRACT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "extract.sh")
+
+
+def load_table_list(script_path: str = EXTRACT_SCRIPT) -> list:
+    """Reads the `tables=(...)` list from extract.sh so both backends export the same tables."""
+    with open(script_path) as f:
+        script = f.read()
+    match = re.search(r"tables=\((.*?)\)", script, re.DOTALL)
+    tables = re.findall(r"'([^']+)'", match.group(1)) if match else []
+    # Drop repeated table names so two jobs never write the same file
+    return list(dict.fromkeys(tables))
+
+def output_base_name(mdb_path: str) -> str:
+    """Same source name extract.sh builds: no spaces, underscores replaced by dashes."""
+    base_filename = os.path.splitext(os.path.basename(mdb_path))[0]
+    return base_filename.replace(" ", "").replace("_", "-")
+
+def list_mdb_tables(mdb_path: str) -> set:
+    """Tables present in an Access file, so missing ones are skipped without spawning mdb-export."""
+    result = subprocess.run(["mdb-tables", "-1", mdb_path], capture_output=True, text=True)
+    if result.returncode != 0:
+        logger.error(f"Failed to list tables in {mdb_path}: {result.stderr.strip()}")
+        return set()
+    return set(result.stdout.split())
+
+def count_lines(file_path: str, chunk_size: int = 1024 * 1024) -> int:
+    """Counts newlines like `wc -l`, reading the file in chunks."""
+    lines = 0
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            lines += chunk.count(b"\n")
+    return lines
+
+def extract_table(mdb_path: str, table: str, output_dir: str, partial_dir: str, output_format: str = "csv"):
+    """
+    Streams one table out of an Access file with mdb-export.
+    Returns (mdb_path, table, seconds, rows, status) with status "ok", "empty" or "failed".
+    """
+    file_name = f"{output_base_name(mdb_path)}_{table.replace('_', '')}"
+    partial_path = os.path.join(partial_dir, f"{file_name}.csv")
+
+    start = time.perf_counter()
+    with open(partial_path, "wb") as out:
+        result = subprocess.run(["mdb-export", mdb_path, table], stdout=out, stderr=subprocess.PIPE)
+    row_count = max(count_lines(partial_path) - 1, 0)  # header row doesn't count
+
+    status = "ok"
+    if result.returncode != 0:
+        logger.error(f"Failed to extract {table} from {mdb_path}: {result.stderr.decode(errors='replace').strip()}")
+        status = "failed"
+    elif row_count < 1:
+        logger.info(f"Skipping {table} from {mdb_path} as it has no data rows.")
+        status = "empty"
+    elif output_format == "parquet":
+        from _2_dima_loadingest.scripts.schema_registry import scan_csv_with_schema
+
+        scan_csv_with_schema(partial_path).sink_parquet(os.path.join(output_dir, f"{file_name}.parquet"))
+    else:
+        os.replace(partial_path, os.path.join(output_dir, f"{file_name}.csv"))
+
+    if os.path.exists(partial_path):
+        os.remove(partial_path)
+
+    elapsed = time.perf_counter() - start
+    if status == "ok":
+        logger.info(f"Extracted {table} from {mdb_path} ({row_count} rows, {elapsed:.2f}s)")
+    return mdb_path, table, elapsed, row_count, status
+
+def extract_all(dima_dir: str, output_dir: str, jobs: int, output_format: str = "csv", tables: list = None) -> int:
+    """
+    Extracts every table of every .mdb file in dima_dir on a pool of `jobs` mdb-export processes.
+    Prints per-file timings and returns the number of failed tables.
+    """
+    if shutil.which("mdb-export") is None or shutil.which("mdb-tables") is None:
+        raise FileNotFoundError("mdbtools (mdb-export, mdb-tables) is not installed on this host")
+
+    tables = tables or load_table_list()
+    mdb_files = sorted(
+        os.path.join(dima_dir, f) for f in os.listdir(dima_dir) if f.lower().endswith((".mdb", ".accdb"))
+    )
+    os.makedirs(output_dir, exist_ok=True)
+
+    extract_start = time.perf_counter()
+    # partial files live next to the output so finished tables are moved in atomically
+    with tempfile.TemporaryDirectory(dir=output_dir, prefix=".partial-") as partial_dir:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = []
+            for mdb_path in mdb_files:
+                present = list_mdb_tables(mdb_path)
+                for table in tables:
+                    if table in present:
+                        futures.append(executor.submit(
+                            extract_table, mdb_path, table, output_dir, partial_dir, output_format
+                        ))
+            results = [future.result() for future in futures]
+
+    # Per-file timing summary (seconds are summed across that file's tables)
+    per_file = defaultdict(lambda: {"tables": 0, "rows": 0, "seconds": 0.0})
+    for mdb_path, table, elapsed, rows, status in results:
+        per_file[mdb_path]["seconds"] += elapsed
+        per_file[mdb_path]["rows"] += rows
+        if status == "ok":
+            per_file[mdb_path]["tables"] += 1
+
+    print(f"Extraction finished in {time.perf_counter() - extract_start:.2f}s with {jobs} parallel jobs")
+    for mdb_path, summary in sorted(per_file.items()):
+        print(f"{mdb_path}: {summary['tables']} tables, {summary['rows']} rows, {summary['seconds']:.2f}s")
+
+    return sum(1 for result in results if result[4] == "failed")
@@ -5,11 +5,25 @@ import logging.config
 
 load_dotenv()
 
-# postgres schema to ingest into
-SCHEMA = "dima_prod"
+# postgres schema to ingest into; the DIMA_SCHEMA environment variable overrides it
+# (benchmarks/run_benchmarks.py --db postgres uses this to write to its own schema)
+DEFAULT_SCHEMA = "dima_prod"
+SCHEMA = os.getenv("DIMA_SCHEMA", DEFAULT_SCHEMA)
 
 # Dockerfile for the platform agnostic extractor
 DOCKERFILE_DIR = "./_1_dima_extract"
+# .mdb archive, bind-mounted read-only into the extractor containers
+DIMA_DIR = "./_1_dima_extract/dimas"
+# extractor image name; the tag is a hash of Dockerfile + extract.sh
+EXTRACT_IMAGE = "dima-extract"
+# tables exported at the same time by extract.sh (split across shard containers)
+EXTRACT_JOBS = os.cpu_count() or 1
+# containers the .mdb files are spread across by `extract`
+EXTRACT_SHARDS = 1
+# "docker" runs extract.sh in containers, "local" runs mdbtools on the host
+EXTRACT_BACKEND = "docker"
+# file format written by the local backend: "csv" or "parquet"
+EXTRACT_FORMAT = "csv"
 
 # DB credentials, modify .env file
 # PROD or DEV available
@@ -21,11 +35,106 @@ DATABASE_CONFIG = {
     "port": os.getenv('PROD_DBPORT'),
 }
 
+# Connection pool shared by every db_connector call in an ingest run
+DB_POOL_MIN = 1
+DB_POOL_MAX = 8
+
+# Bulk load settings: "copy" streams frames with COPY FROM STDIN, "insert" is row-by-row
+INSERT_METHOD = "copy"
+COPY_BATCH_SIZE = 50000
+
+# where joined tables are written: "postgres", "parquet" or both (`ingest --sinks=postgres,parquet`)
+OUTPUT_SINKS = ["postgres"]
+# Parquet sink: <dir>/<table>/data_type=<data_type>/DBKey=<source>/part-0.parquet
+PARQUET_SINK_DIR = "./_2_dima_loadingest/parquet"
+PARQUET_COMPRESSION = "zstd"
+PARQUET_ROW_GROUP_SIZE = 128 * 1024
+
+# hand finished frames to background writer threads through a bounded queue so parsing
+# overlaps loading; the queue size caps how many frames wait in memory
+ASYNC_DB_WRITER = True
+DB_WRITER_WORKERS = 4
+DB_WRITER_QUEUE_SIZE = 8
+
+# "append" adds rows; "upsert" merges each load on its key columns so reloading a DIMA replaces its rows.
+# In both modes a file already in the ingest manifest first deletes its DIMA's rows (DBKey) when it is loaded again
+LOAD_MODE = "append"
+# bulk-load mode for full runs (`ingest --full`): drop the non-unique indexes of the tables
+# being loaded, load, then build indexes on PrimaryKey/DBKey/join keys (fulljoin_key,
+# lineplotjoin_key) in parallel and ANALYZE. Indexes leading with DBKey are kept, and the dropped
+# definitions are saved in BULK_LOAD_INDEX_TABLE until rebuilt. Incremental runs keep every index
+BULK_LOAD = True
+INDEX_BUILD_WORKERS = 4
+BULK_LOAD_INDEX_TABLE = "bulk_load_dropped_indexes"
+# upsert strategy: "delete_insert" (works for repeating detail keys) or "on_conflict" (unique keys only)
+UPSERT_STRATEGY = "delete_insert"
+
+# date formats tried by format_dates on every loaded table and pksource, in order of preference;
+# each column's format is detected from a sample
+DATE_FORMATS = [
+    "%m/%d/%y %H:%M:%S",
+    "%m/%d/%Y %H:%M:%S",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d",
+    "%m/%d/%Y",
+    "%m/%d/%y",
+]
+DATE_SAMPLE_SIZE = 1000
+
 # Variables for column additions / modifications
 TODAYS_DATE = date.today().isoformat()
 
 # CLI variables
 DATA_DIR = "./_1_dima_extract/extracted"
+# worker threads used by `ingest`; 1 processes files serially
+INGEST_WORKERS = os.cpu_count() or 1
+# stream each file through a lazy scan -> join -> COPY pipeline instead of holding frames in memory
+LAZY_INGEST = False
+# strings read as null from extracted CSVs
+CSV_NULL_VALUES = ["NA", "N/A", "null"]
+# explicit CSV column types: "learn" infers unknown columns once and persists them,
+# "builtin" reads columns missing from the registry as text
+SCHEMA_REGISTRY_MODE = "learn"
+SCHEMA_REGISTRY_PATH = "./_2_dima_loadingest/schema_registry.json"
+# write each table to the database as soon as it has its PrimaryKey and drop it from memory;
+# False keeps every loaded table in temp_storage for the whole run
+FLUSH_TO_DB = True
+# check joined tables against their pksource before writing them (scripts/validator.py);
+# with `ingest --lazy` each table is checked by an extra streaming scan of its file
+VALIDATE_BEFORE_LOAD = True
+# largest share of a table's rows a check may flag before the table is not loaded; None only reports
+VALIDATION_THRESHOLDS = {
+    "null_key": 0.05,
+    "orphans": 0.05,
+    "duplicate_keys": None,
+    "duplicate_rows": None,
+}
+# per data type overrides of VALIDATION_THRESHOLDS. The Base pksource is tblGap header/detail
+# joined to Lines-Plots, so lines and plots without Gap data have no PrimaryKey by design:
+# Base tables (tblLines, tblPlots, tblGap*) are only reported, never held back
+VALIDATION_THRESHOLDS_BY_DATA_TYPE = {
+    "Base": {"null_key": None, "orphans": None},
+}
+# skip files whose content hash matches the ingest manifest ("ingest --full" reloads everything)
+INCREMENTAL_INGEST = True
+# "file" keeps the manifest in MANIFEST_PATH, "table" in SCHEMA.MANIFEST_TABLE
+MANIFEST_BACKEND = "file"
+MANIFEST_PATH = "./_2_dima_loadingest/ingest_manifest.json"
+MANIFEST_TABLE = "ingest_manifest"
+# after loading, store key columns and repeated strings as Categorical and shrink integer columns.
+# Eager path only: `ingest --lazy` streams tables without holding them, so it compacts nothing
+COMPACT_FRAMES = True
+# a text column is dictionary-encoded when its distinct values are at most this share of its rows
+CATEGORICAL_MAX_RATIO = 0.5
+# join detail tables to the pksource on dictionary-encoded integer keys instead of text keys
+COMPACT_JOIN_KEYS = False
+# record wall time, rows, bytes read and peak RSS per stage and table; summarized at the end of `ingest`
+METRICS_ENABLED = True
+# optional JSON-lines file every stage record is appended to, e.g. "./_2_dima_loadingest/logs/metrics.jsonl"
+METRICS_PATH = None
+# upper bound for parsed Lines/Plots/header frames kept in memory during a run
+FRAME_CACHE_MAX_BYTES = 2 * 1024 ** 3
 
 
 # Configuration options for logs
@@ -59,6 +168,8 @@ LOGGING_CONFIG = {
     },
 }
 
+# logs/ is not tracked, create it before the file handler opens app.log
+os.makedirs(os.path.dirname(LOGGING_CONFIG['handlers']['file']['filename']), exist_ok=True)
 logging.config.dictConfig(LOGGING_CONFIG)
 
 
@@ -0,0 +1,151 @@
+import polars as pl
+import logging
+import os, os.path
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from _2_dima_loadingest.scripts.manifest import ingest_manifest
+from _2_dima_loadingest.scripts.schema_registry import (
+    read_csv_with_schema,
+    scan_csv_with_schema,
+)
+
+logger = logging.getLogger(__name__)
+
+"""
+Columnar hand-off between extract and ingest.
+
+Extracted tables can be stored as Parquet or Arrow IPC next to (or instead of)
+the CSVs. These files already carry their column types, are read memory-mapped,
+and support column projection, so a step that needs a few columns only reads those.
+"""
+
+# extension -> format name, in order of preference when one table exists in several formats
+INGEST_EXTENSIONS = {
+    ".parquet": "parquet",
+    ".arrow": "ipc",
+    ".csv": "csv",
+}
+
+
+def file_format(file_path: str) -> str:
+    return INGEST_EXTENSIONS.get(os.path.splitext(file_path)[1].lower())
+
+def is_columnar(file_path: str) -> bool:
+    return file_format(file_path) in ("parquet", "ipc")
+
+def select_ingest_files(file_names: list, data_dir: str = None) -> list:
+    """
+    Keeps one file per extracted table: Parquet over Arrow IPC over CSV, so a
+    converted table is not ingested twice. Other files are dropped.
+    With data_dir, a columnar file older than its CSV (left over from before a
+    re-extract) is passed over for the CSV, as convert_csv_files would redo it.
+    """
+    preference = list(INGEST_EXTENSIONS)
+    candidates = {}
+    for file_name in file_names:
+        stem, ext = os.path.splitext(file_name)
+        if ext.lower() in INGEST_EXTENSIONS:
+            candidates.setdefault(stem, []).append(file_name)
+
+    chosen = []
+    for stem in sorted(candidates):
+        files = sorted(candidates[stem], key=lambda f: preference.index(os.path.splitext(f)[1].lower()))
+        csv_file = next((f for f in files if file_format(f) == "csv"), None)
+        if data_dir is not None and csv_file is not None:
+            csv_mtime = os.path.getmtime(os.path.join(data_dir, csv_file))
+            files = [
+                f for f in files
+                if f == csv_file or os.path.getmtime(os.path.join(data_dir, f)) >= csv_mtime
+            ]
+        chosen.append(files[0])
+    return chosen
+
+def table_columns(file_path: str) -> list:
+    """Column names of an extracted table without reading its rows."""
+    fmt = file_format(file_path)
+    if fmt == "parquet":
+        return list(pl.read_parquet_schema(file_path))
+    if fmt == "ipc":
+        return list(pl.read_ipc_schema(file_path))
+    return pl.read_csv(file_path, n_rows=0).columns
+
+def read_table_file(file_path: str, columns: list = None) -> pl.DataFrame:
+    """
+    Reads an extracted table. Parquet/IPC files are memory-mapped and only the
+    requested columns are read; CSVs are parsed with the schema registry.
+    """
+    fmt = file_format(file_path)
+    if fmt == "parquet":
+        return pl.read_parquet(file_path, columns=columns, memory_map=True)
+    if fmt == "ipc":
+        return pl.read_ipc(file_path, columns=columns, memory_map=True)
+    df = read_csv_with_schema(file_path)
+    return df.select(columns) if columns is not None else df
+
+def scan_table_file(file_path: str) -> pl.LazyFrame:
+    """Lazy scan of an extracted table in any supported format."""
+    fmt = file_format(file_path)
+    if fmt == "parquet":
+        return pl.scan_parquet(file_path)
+    if fmt == "ipc":
+        return pl.scan_ipc(file_path, memory_map=True)
+    return scan_csv_with_schema(file_path)
+
+def convert_csv_file(file_path: str, output_format: str = "parquet") -> str:
+    """
+    Writes a CSV once as Parquet or Arrow IPC next to it and returns the new path.
+    The file is written under a temporary name and moved into place, so an interrupted
+    conversion never leaves a truncated file that ingest would prefer over the CSV.
+    """
+    stem = os.path.splitext(file_path)[0]
+    output_path = f"{stem}.arrow" if output_format == "ipc" else f"{stem}.parquet"
+    lf = scan_csv_with_schema(file_path)
+
+    fd, partial_path = tempfile.mkstemp(
+        dir=os.path.dirname(output_path) or ".", prefix=f".{os.path.basename(stem)}-", suffix=".partial",
+    )
+    os.close(fd)
+    try:
+        if output_format == "ipc":
+            lf.sink_ipc(partial_path)
+        else:
+            lf.sink_parquet(partial_path)
+        os.replace(partial_path, output_path)
+    except Exception:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    return output_path
+
+def convert_csv_files(data_dir: str, output_format: str = "parquet", max_workers: int = 1) -> int:
+    """
+    Converts every extracted CSV in data_dir to a columnar file, skipping those already
+    converted after the CSV last changed. A converted CSV that the ingest manifest has
+    as loaded and unchanged keeps that entry under the new file's name.
+    Returns the number of files written.
+    """
+    extension = ".arrow" if output_format == "ipc" else ".parquet"
+    pending = []
+    for file_name in sorted(os.listdir(data_dir)):
+        if not file_name.endswith(".csv"):
+            continue
+        file_path = os.path.join(data_dir, file_name)
+        output_path = os.path.splitext(file_path)[0] + extension
+        if os.path.exists(output_path) and os.path.getmtime(output_path) >= os.path.getmtime(file_path):
+            continue
+        pending.append(file_path)
+
+    def convert(file_path):
+        try:
+            output_path = convert_csv_file(file_path, output_format)
+            logger.info(f"Converted {file_path} -> {output_path}")
+            ingest_manifest.carry_over(file_path, output_path)
+            return True
+        except Exception as e:
+            logger.error(f"Failed to convert {file_path}: {e}")
+            return False
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        converted = sum(executor.map(convert, pending))
+    logger.info(f"Converted {converted} of {len(pending)} CSV files to {output_format}")
+    return converted
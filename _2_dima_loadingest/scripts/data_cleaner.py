@@ -1,4 +1,5 @@
-from _2_dima_loadingest.config import TODAYS_DATE
+from _2_dima_loadingest.config import TODAYS_DATE, CATEGORICAL_MAX_RATIO
+from _2_dima_loadingest.scripts.metrics import pipeline_metrics
 import polars as pl
 import logging
 
@@ -15,3 +16,57 @@ def add_date_loaded_column(df: pl.DataFrame) -> pl.DataFrame:
 
 def deduplicate_dataframe(df: pl.DataFrame) -> pl.DataFrame:
     return df.unique()
+
+# integer dtypes a column may shrink to, smallest first, with their bit widths
+INT_DTYPES = {pl.Int8: 8, pl.Int16: 16, pl.Int32: 32, pl.Int64: 64}
+
+def int_range(dtype):
+    bits = INT_DTYPES[dtype]
+    return -(2 ** (bits - 1)), 2 ** (bits - 1) - 1
+
+def is_key_column(column: str) -> bool:
+    """Join and primary key columns; always encoded so both sides of a join share a dtype."""
+    return column.lower().endswith("key")
+
+def compact_dataframe(df: pl.DataFrame, label: str = None, max_unique_ratio: float = CATEGORICAL_MAX_RATIO) -> pl.DataFrame:
+    """
+    Shrinks a loaded frame in memory: key columns and text columns with few distinct
+    values become Categorical, integer columns the smallest integer type holding their
+    values. Statistics for every column are gathered in one pass. Logs the memory saved.
+    """
+    if df is None or df.height == 0:
+        return df
+
+    schema = df.schema
+    text_cols = [col for col, dtype in schema.items() if dtype == pl.String]
+    int_cols = [col for col, dtype in schema.items() if dtype.is_integer() and dtype != pl.Int8]
+    stat_exprs = (
+        [pl.col(col).n_unique().alias(f"{col}__n_unique") for col in text_cols if not is_key_column(col)]
+        + [pl.col(col).min().alias(f"{col}__min") for col in int_cols]
+        + [pl.col(col).max().alias(f"{col}__max") for col in int_cols]
+    )
+    stats = df.select(stat_exprs).row(0, named=True) if stat_exprs else {}
+
+    casts = []
+    for col in text_cols:
+        if is_key_column(col) or stats[f"{col}__n_unique"] <= max_unique_ratio * df.height:
+            casts.append(pl.col(col).cast(pl.Categorical))
+    for col in int_cols:
+        low, high = stats[f"{col}__min"], stats[f"{col}__max"]
+        if low is None:
+            continue
+        dtype = next((d for d in INT_DTYPES if int_range(d)[0] <= low and high <= int_range(d)[1]), schema[col])
+        if dtype != schema[col]:
+            casts.append(pl.col(col).cast(dtype))
+    if not casts:
+        return df
+
+    with pipeline_metrics.stage("compact_dataframe") as record:
+        before = df.estimated_size()
+        df = df.with_columns(casts)
+        after = df.estimated_size()
+        record.update(rows_in=df.height, rows_out=df.height, memory_before_bytes=before, memory_after_bytes=after)
+
+    saved = 1 - after / before if before else 0
+    logger.info(f"Compacted {label or 'frame'}: {before / 1024 ** 2:.2f} MiB -> {after / 1024 ** 2:.2f} MiB ({saved:.0%} saved)")
+    return df
@@ -1,53 +1,85 @@
 import polars as pl
 import logging
 import os, os.path
+from collections import defaultdict
 from datetime import datetime
 from _2_dima_loadingest.config import (
     # static config variables
     DATA_DIR,
+    FLUSH_TO_DB,
+    COMPACT_FRAMES,
+    VALIDATE_BEFORE_LOAD,
+    fulljoin_key,
     lineplotjoin_key,
     pkdate_source
 )
+from _2_dima_loadingest.scripts.sinks import write_to_sinks, sink_names
+from _2_dima_loadingest.scripts.data_cleaner import compact_dataframe
+from _2_dima_loadingest.scripts.db_writer import db_writer
+from _2_dima_loadingest.scripts.manifest import ingest_manifest
+from _2_dima_loadingest.scripts.metrics import instrument, pipeline_metrics
+from _2_dima_loadingest.scripts.validator import validate_unit, validate_lazy_table
 from _2_dima_loadingest.scripts.utils import (
     # process_csv helper functions
     load_csv_file,
+    scan_csv_file,
     add_timestamps_and_source,
     store_dataframe,
     temp_storage,
     pksources,
+    storage_lock,
+    drop_join_indexes,
+    clear_storage,
     perform_ordered_joins,
+    join_primary_key_lazy,
+    target_table_name,
+    upsert_key_columns,
 
     # create_pksource helper functions
     create_primary_key,
     format_dates,
     find_and_load_files,
+    load_lines_plots,
     join_dataframes,
     classify_table,
 )
 
 logger = logging.getLogger(__name__)
 
-def process_csv(file_name: str, project_key: str = None):
+# file each held table came from, keyed by (source, data_type, table_type), for the manifest
+stored_files = {}
+# table types the lazy path skipped because their unit had no pksource, keyed by (source, data_type)
+held_lazy = defaultdict(list)
+
+@instrument()
+def process_csv(file_name: str, project_key: str = None, table: tuple = None):
     """
     Processes a CSV file:
     1. Classifies table type, data type, and source.
-    2. Loads CSV data.
+    2. Loads CSV data and parses its date columns (format_dates).
     3. Adds timestamps & source column.
     4. Stores data in temporary storage.
     5. Ensures PrimaryKey source exists and performs ordered joins.
+    6. Flushes every table that has its PrimaryKey to the database and drops it from
+       memory (FLUSH_TO_DB); tables whose pksource is not ready yet are held back.
+    7. Records a file in the ingest manifest once a sink has written it; without
+       FLUSH_TO_DB nothing is written, so nothing is recorded.
+    All state is kept per (source, data_type) unit, so files from different DIMAs never mix.
+    table is the file's classify_table result when the caller already has it; the call's
+    stages are recorded under the caller's metrics context.
     """
     logger.info(f"Processing file: {file_name}")
 
     # Classify Table Type
-    source, data_type, table_type = classify_table(file_name)
+    source, data_type, table_type = table or classify_table(file_name)
     if not source or not table_type or not data_type:
         logger.warning(f"Skipping {file_name}: Unable to classify table.")
         return
 
-    # Ensure Primary Key Source Exists
-    if data_type not in pksources:
-        logger.info(f"Creating pksource for table: {table_type}")
-        create_pksource_per_datatype(data_type)
+    # Ensure Primary Key Source Exists (for tables that fulljoin_key joins to it)
+    if table_type in fulljoin_key.get(data_type, {}) and (source, data_type) not in pksources:
+        logger.info(f"Creating pksource for table: {source} {table_type}")
+        create_pksource_per_datatype(data_type, source)
 
     # Load CSV
     filepath = os.path.normpath(os.path.join(DATA_DIR, file_name))
@@ -58,35 +90,184 @@ def process_csv(file_name: str, project_key: str = None):
         logger.error(f"Skipping {file_name}: Failed to load CSV.")
         return
 
+    # Parse date columns before compaction turns repeated date strings into Categorical
+    csv_df = format_dates(csv_df)
+
+    # Dictionary-encode keys/repeated strings and shrink integers
+    if COMPACT_FRAMES:
+        csv_df = compact_dataframe(csv_df, file_name)
+
     # Add Timestamp & Source
     csv_df = add_timestamps_and_source(csv_df, source)
 
     # Store DataFrame
-    store_dataframe(data_type, table_type, csv_df)
+    store_dataframe(source, data_type, table_type, csv_df)
+    with storage_lock:
+        stored_files[(source, data_type, table_type)] = (file_name, filepath)
+
+    # Perform Ordered Joins (only this file's table; tables held earlier had no pksource to join)
+    perform_ordered_joins(source, data_type, table_type)
+
+    # files are recorded in the manifest once a sink wrote them, so held tables are retried next run
+    if FLUSH_TO_DB:
+        flush_ready_tables(source, data_type)
+
+def flush_ready_tables(source, data_type):
+    """
+    Writes every table of a (source, data_type) unit that is ready (has its PrimaryKey,
+    or needs none) to the database, then drops it from temp_storage.
+    With VALIDATE_BEFORE_LOAD the tables are first checked against the pksource and a
+    table over a validation threshold of its data type is dropped instead of written (and not
+    recorded in the manifest, so the next run tries it again).
+    When the DB writer is running the loads are queued to it and this returns straight
+    away (blocking only while its queue is full); otherwise they run here.
+    Tables still waiting for their pksource stay in memory.
+    Returns the table types flushed.
+    """
+    unit = (source, data_type)
+    with storage_lock:
+        tables = temp_storage.get(unit, {})
+        ready = [
+            table_type for table_type, df in tables.items()
+            if data_type == "NoPrimaryKey" or "PrimaryKey" in df.columns
+        ]
+        ready_frames = {table_type: tables.pop(table_type) for table_type in ready}
+        if unit in temp_storage and not temp_storage[unit]:
+            del temp_storage[unit]
+        pk_source = pksources.get(unit)
+
+    checks = {}
+    if VALIDATE_BEFORE_LOAD and ready_frames:
+        with pipeline_metrics.context(source, data_type, None), pipeline_metrics.stage("validate_unit") as record:
+            record["rows_in"] = sum(df.height for df in ready_frames.values())
+            checks = validate_unit(
+                source, data_type, ready_frames, pk_source,
+                {table_type: target_table_name(data_type, table_type) for table_type in ready_frames},
+            )
+
+    for table_type, df in ready_frames.items():
+        table_name = target_table_name(data_type, table_type)
+        with storage_lock:
+            file_name, filepath = stored_files.pop((source, data_type, table_type), (None, None))
+        if checks.get(table_type, {}).get("failed"):
+            logger.error(f"Not loading {file_name or table_name}: validation failed")
+            continue
+
+        def write(df=df, table_name=table_name, table_type=table_type, file_name=file_name, filepath=filepath):
+            # a file loaded in an earlier run replaces that load's rows instead of adding to them
+            replace = bool(file_name) and ingest_manifest.loaded_before(file_name)
+            rows = write_to_sinks(df, table_name, source, data_type, upsert_key_columns(data_type, table_type), replace)
+            if rows is not None and file_name:
+                ingest_manifest.record(file_name, filepath, source, table_name, rows, sink_names())
+            return rows
+
+        context = (source, data_type, table_type)
+        if db_writer.running:
+            db_writer.submit(table_name, write, file_name, context)
+        else:
+            with pipeline_metrics.context(*context):
+                write()
+
+    with storage_lock:
+        held = list(temp_storage.get(unit, {}))
+    if held:
+        logger.info(f"Holding {source} {data_type} tables {held} until their pksource is ready")
+    return list(ready_frames)
+
+def report_held_tables():
+    """
+    Logs the tables still held at the end of a run because their pksource never became
+    ready, including those the lazy path skipped (cleared once reported).
+    """
+    with storage_lock:
+        held = {unit: list(tables) for unit, tables in temp_storage.items() if tables}
+        for unit, table_types in held_lazy.items():
+            held.setdefault(unit, []).extend(table_types)
+        held_lazy.clear()
+    for (source, data_type), table_types in held.items():
+        logger.warning(f"Not loaded, no PrimaryKey source for {source} {data_type}: {table_types}")
+    return held
+
+def clear_run_state():
+    """Drops every frame and held table of the run, so nothing carries over into the next `ingest`."""
+    clear_storage()
+    with storage_lock:
+        stored_files.clear()
+        held_lazy.clear()
+
+@instrument()
+def process_csv_lazy(file_name: str, table: tuple = None):
+    """
+    Streams a CSV file straight into the database:
+    scan_csv -> date parsing -> timestamps & source -> PrimaryKey join -> COPY in streaming batches.
+    Only the unit's pksource is materialized, so tables larger than RAM can be ingested.
+    A table whose unit has no pksource is not loaded (nor recorded in the manifest, so the
+    next run tries it again) and is listed by report_held_tables. With VALIDATE_BEFORE_LOAD
+    the joined scan is checked first (validate_lazy_table) and skipped when it fails.
+    Frames are never held here, so COMPACT_FRAMES does not apply.
+    table is the file's classify_table result, as for process_csv.
+    """
+    logger.info(f"Streaming file: {file_name}")
+
+    source, data_type, table_type = table or classify_table(file_name)
+    if not source or not table_type or not data_type:
+        logger.warning(f"Skipping {file_name}: Unable to classify table.")
+        return
+
+    if table_type in fulljoin_key.get(data_type, {}) and (source, data_type) not in pksources:
+        create_pksource_per_datatype(data_type, source)
+    if data_type != "NoPrimaryKey" and (source, data_type) not in pksources:
+        logger.info(f"Holding {source} {data_type} table {table_type} until its pksource is ready")
+        with storage_lock:
+            held_lazy[(source, data_type)].append(table_type)
+        return
+
+    filepath = os.path.normpath(os.path.join(DATA_DIR, file_name))
+    lf = format_dates(scan_csv_file(filepath))
+    lf = add_timestamps_and_source(lf, source)
+    lf = join_primary_key_lazy(lf, source, data_type, table_type)
+
+    table_name = target_table_name(data_type, table_type)
+    if VALIDATE_BEFORE_LOAD:
+        with pipeline_metrics.stage("validate_unit"):
+            checks = validate_lazy_table(source, data_type, table_type, lf, pksources.get((source, data_type)), table_name)
+        if checks.get("failed"):
+            logger.error(f"Not loading {file_name}: validation failed")
+            return
 
-    # Perform Ordered Joins
-    perform_ordered_joins(data_type)
+    # with several sinks the scan runs once per sink
+    rows = write_to_sinks(
+        lf, table_name, source, data_type, upsert_key_columns(data_type, table_type),
+        ingest_manifest.loaded_before(file_name),
+    )
+    if rows is not None:
+        ingest_manifest.record(file_name, filepath, source, table_name, rows, sink_names())
 
 
-def create_pksource_per_datatype(data_type):
+@instrument(context=lambda data_type, source=None, files=None: (source, data_type, None))
+def create_pksource_per_datatype(data_type, source=None, files=None):
     """
     Creates a primary key source DataFrame for a given data type by dynamically loading
     and joining relevant files, with special handling for 'Base'.
+    Only the files of the given source DIMA are used; the result is stored under
+    pksources[(source, data_type)]. files is the source's already listed file names
+    (from the ingest plan); the data directory is listed when omitted.
+    Returns the pksource, or None when it could not be built.
     """
-    logger.info(f"Creating primary key source for data type: {data_type}")
+    logger.info(f"Creating primary key source for data type: {source} {data_type}")
     if data_type == "NoPrimaryKey":
         logger.info("Skipping as no primary key is required.")
         return
 
     # Load relevant files
-    data_files = find_and_load_files(data_type, DATA_DIR)
+    data_files = find_and_load_files(data_type, DATA_DIR, source, files)
 
     if data_files["lines"] is None or data_files["plots"] is None:
         logger.error(f"Missing essential files for {data_type}, skipping...")
         return
 
-    # Create initial Lines-Plots join
-    lines_plots_df = join_dataframes(data_files["lines"], data_files["plots"], "PlotKey")
+    # Create initial Lines-Plots join (shared by every data type of this source)
+    lines_plots_df = load_lines_plots(DATA_DIR, source, files)
 
     # Identify the primary join key
     join_key = lineplotjoin_key.get(data_type)
@@ -129,10 +310,17 @@ def create_pksource_per_datatype(data_type):
     # Create Primary Key
     primary_key_col = pkdate_source.get(data_type, "FormDate")
     final_source_df = create_primary_key(final_source_df, ["PlotKey", primary_key_col])
+    if COMPACT_FRAMES:
+        # key columns become Categorical, like the compacted tables joined to them
+        final_source_df = compact_dataframe(final_source_df, f"{source} {data_type} pksource")
 
     # Store in pksources dictionary
-    pksources[data_type] = final_source_df
-    logger.info(f"Stored primary key source for {data_type}")
+    # join indexes built on an earlier pksource of this unit hold its old PrimaryKeys
+    with storage_lock:
+        pksources[(source, data_type)] = final_source_df
+        drop_join_indexes(source, data_type)
+    logger.info(f"Stored primary key source for {source} {data_type}")
+    return final_source_df
 
 
 def pksources_getter():
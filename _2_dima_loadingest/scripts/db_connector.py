@@ -1,13 +1,82 @@
-import psycopg2
-from _2_dima_loadingest.config import DATABASE_CONFIG, SCHEMA
+from psycopg2 import pool
+from _2_dima_loadingest.config import (
+    DATABASE_CONFIG,
+    SCHEMA,
+    INSERT_METHOD,
+    COPY_BATCH_SIZE,
+    DB_POOL_MIN,
+    DB_POOL_MAX,
+    INDEX_BUILD_WORKERS,
+    BULK_LOAD_INDEX_TABLE,
+    LOAD_MODE,
+    UPSERT_STRATEGY,
+)
+from _2_dima_loadingest.scripts.metrics import instrument
+from _2_dima_loadingest.scripts.table_catalog import table_catalog
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 import polars as pl
 import logging
+import threading
+import io
+import time
 
 logger = logging.getLogger(__name__)
 
+# connection pool shared by the whole ingest run, created on first use
+_pool = None
+_pool_lock = threading.Lock()
+# ThreadedConnectionPool.getconn raises PoolError when every connection is out instead of
+# waiting, so sessions take a slot first and wait here while DB_POOL_MAX are in use
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+# set from prepare_bulk_load until finish_bulk_load: non-unique indexes are only built at the end
+bulk_load_active = threading.Event()
+
+
+def get_pool():
+    """Returns the shared connection pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DATABASE_CONFIG)
+            logger.info(f"Opened connection pool ({DB_POOL_MIN}-{DB_POOL_MAX} connections)")
+        return _pool
+
+def close_pool():
+    """Closes every pooled connection. Called at the end of an ingest run."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+            logger.info("Closed connection pool")
+        _pool = None
+
+@contextmanager
+def db_session():
+    """
+    Borrows a pooled connection for one transaction, waiting while all
+    DB_POOL_MAX connections are in use. Commits when the block exits cleanly, rolls back on error and always
+    returns the connection to the pool. DDL staged in the table catalog during
+    the transaction is published on commit and dropped on rollback.
+    """
+    with _pool_slots:
+        db_pool = get_pool()
+        conn = db_pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+            table_catalog.publish(conn)
+        except Exception:
+            conn.rollback()
+            table_catalog.discard(conn)
+            raise
+        finally:
+            db_pool.putconn(conn)
+
 
 def map_dtype_to_sql(dtype: pl.DataType) -> str:
-    if dtype == pl.Int64 or dtype == pl.Int32:
+    # compacted frames hold small integer types; the column stays INTEGER so other DIMAs fit
+    if dtype.is_integer():
         return "INTEGER"
     elif dtype == pl.Float64 or dtype == pl.Float32:
         return "FLOAT"
@@ -16,69 +85,386 @@ def map_dtype_to_sql(dtype: pl.DataType) -> str:
     else:
         return "TEXT"
 
-def create_table_if_not_exists(df: pl.DataFrame, table_name: str):
-    conn = None
-    try:
+# information_schema data_type -> frame dtype a column is cast to before COPY
+SQL_TO_DTYPE = {
+    "smallint": pl.Int64,
+    "integer": pl.Int64,
+    "bigint": pl.Int64,
+    "real": pl.Float64,
+    "double precision": pl.Float64,
+    "numeric": pl.Float64,
+    "date": pl.Date,
+    "timestamp without time zone": pl.Datetime,
+    "boolean": pl.Boolean,
+    "text": pl.String,
+    "character varying": pl.String,
+}
 
-        conn = psycopg2.connect(**DATABASE_CONFIG)
-        cursor = conn.cursor()
+# map_dtype_to_sql type -> the data_type information_schema reports for it
+CATALOG_TYPE_NAMES = {"FLOAT": "double precision"}
 
-        # Dynamically create a SQL CREATE TABLE statement based on the DataFrame columns
-        columns = [f'"{col}" {map_dtype_to_sql(dtype)}' for col, dtype in zip(df.columns, df.dtypes)]
-        columns_sql = ", ".join(columns)
+def catalog_types(column_sql_types: dict) -> dict:
+    return {col: CATALOG_TYPE_NAMES.get(sql_type, sql_type.lower()) for col, sql_type in column_sql_types.items()}
+
+def lock_table_ddl(table_name: str, conn):
+    """
+    Takes a transaction-scoped advisory lock on SCHEMA.table_name, so sessions loading
+    the same table run their CREATE/ALTER one at a time; it is released on commit or rollback.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"{SCHEMA}.{table_name}",))
+
+def create_table_if_not_exists(df: pl.DataFrame, table_name: str, conn=None):
+    """
+    Makes sure SCHEMA.table_name exists with every column of the DataFrame (or LazyFrame schema).
+    The table catalog is read once per run, so an unchanged table needs no DDL. Otherwise
+    the table's DDL lock is taken and the table is looked up again, since another session
+    may have created it meanwhile; a missing table is created and new columns are added
+    in one ALTER TABLE.
+    When conn is given the DDL joins the caller's transaction, otherwise it
+    runs in its own pooled session.
+    Returns {column: SQL data type} of the table's existing columns (new ones included).
+    """
+    if conn is None:
+        try:
+            with db_session() as session_conn:
+                return create_table_if_not_exists(df, table_name, session_conn)
+        except Exception as e:
+            logger.info(f"Error creating table {table_name}: {e}")
+        return None
 
+    frame_types = {col: map_dtype_to_sql(dtype) for col, dtype in df.collect_schema().items()}
+    existing = table_catalog.columns(table_name, conn)
+    if existing is not None and all(col in existing for col in frame_types):
+        return existing
+
+    lock_table_ddl(table_name, conn)
+    existing = table_catalog.columns(table_name, conn, refresh=True)
+
+    if existing is None:
+        # Dynamically create a SQL CREATE TABLE statement based on the DataFrame columns
+        columns_sql = ", ".join(f'"{col}" {sql_type}' for col, sql_type in frame_types.items())
         create_table_query = f"""
         CREATE TABLE IF NOT EXISTS {SCHEMA}."{table_name}" (
             {columns_sql}
         );
         """
+        with conn.cursor() as cursor:
+            cursor.execute(create_table_query)
+        table_catalog.stage_columns(conn, table_name, catalog_types(frame_types))
+        return catalog_types(frame_types)
 
-        cursor.execute(create_table_query)
-        conn.commit()
+    new_columns = {col: sql_type for col, sql_type in frame_types.items() if col not in existing}
+    if new_columns:
+        add_sql = ", ".join(f'ADD COLUMN IF NOT EXISTS "{col}" {sql_type}' for col, sql_type in new_columns.items())
+        with conn.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {SCHEMA}."{table_name}" {add_sql}')
+        logger.info(f"Added columns {list(new_columns)} to {SCHEMA}.{table_name}")
+        table_catalog.stage_columns(conn, table_name, catalog_types(new_columns))
+        existing.update(catalog_types(new_columns))
+    return existing
 
-        cursor.close()
+def align_to_table(df: pl.DataFrame, column_types: dict) -> pl.DataFrame:
+    """
+    Casts frame columns to the types of the existing table columns, so an existing
+    column keeps its type instead of the one map_dtype_to_sql would infer from this frame.
+    Float columns loading into integer columns are left alone: COPY rejects fractional
+    values instead of them being truncated here.
+    """
+    if not column_types:
+        return df
+    casts = []
+    for col, dtype in df.collect_schema().items():
+        target = SQL_TO_DTYPE.get(column_types.get(col))
+        if target is None or dtype == target:
+            continue
+        if target == pl.String and dtype in (pl.Categorical, pl.Enum):
+            continue  # written as the same text by COPY
+        if target == pl.Int64 and dtype.is_float():
+            continue
+        if target == pl.Date and dtype == pl.Datetime:
+            casts.append(pl.col(col).dt.date())
+        else:
+            casts.append(pl.col(col).cast(target))
+    return df.with_columns(casts) if casts else df
+
+@instrument()
+def insert_dataframe_to_db(df: pl.DataFrame, table_name: str, method: str = INSERT_METHOD,
+                           batch_size: int = COPY_BATCH_SIZE, key_columns: list = None,
+                           mode: str = LOAD_MODE, replace_source: str = None):
+    """
+    Loads a DataFrame into SCHEMA.table_name.
+    The CREATE TABLE and the load run in one transaction on a single pooled
+    connection. method="copy" (default) streams the frame with COPY FROM STDIN
+    in batches of batch_size rows; method="insert" keeps the legacy row-by-row
+    INSERT path. A LazyFrame is collected in streaming mode and each batch is
+    copied as soon as it is produced.
+    With mode="upsert" and key_columns, rows are merged on the key columns
+    instead of appended (see upsert_from_staging).
+    With replace_source, the table's rows of that DBKey are deleted first in the same
+    transaction, so reloading a changed file replaces its previous load.
+    Returns the number of rows loaded, or None when the load failed.
+    """
+    try:
+        with db_session() as conn:
+            # Ensure table exists with every column before inserting data
+            column_types = create_table_if_not_exists(df, table_name, conn)
+            df = align_to_table(df, column_types)
+            if replace_source is not None:
+                delete_source_rows(table_name, replace_source, conn)
+
+            if mode == "upsert" and key_columns:
+                rows = upsert_from_staging(df, table_name, key_columns, conn, batch_size)
+            elif isinstance(df, pl.LazyFrame):
+                rows = copy_batches_to_db(iter_lazy_batches(df, batch_size), df.collect_schema().names(), table_name, conn)
+            elif method == "copy":
+                rows = copy_dataframe_to_db(df, table_name, conn, batch_size)
+            else:
+                rows = insert_rows_to_db(df, table_name, conn)
+        return rows
 
     except Exception as e:
-        if conn:
-            conn.rollback()
-        logger.info(f"Error creating table {table_name}: {e}")
-    finally:
-        if conn:
-            conn.close()
+        logger.error(f"Error inserting DataFrame into {table_name}: {e}")
+        return None
 
-def insert_dataframe_to_db(df: pl.DataFrame, table_name: str):
-    create_table_if_not_exists(df, table_name)  # Ensure table exists before inserting data
+def delete_source_rows(table_name: str, source: str, conn):
+    """Deletes the rows one source DIMA (DBKey) loaded into SCHEMA.table_name."""
+    with conn.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SCHEMA}."{table_name}" WHERE "DBKey" = %s', (source,))
+        logger.info(f"Deleted {cursor.rowcount} rows of {source} from {SCHEMA}.{table_name} before reloading")
 
-    conn = None
-    try:
-        # Convert DataFrame to list of tuples for insertion
-        records = df.to_dicts()
+def iter_lazy_batches(lf: pl.LazyFrame, batch_size: int = COPY_BATCH_SIZE):
+    """Yields DataFrame batches from a LazyFrame using the streaming engine."""
+    if hasattr(lf, "collect_batches"):
+        yield from lf.collect_batches(chunk_size=batch_size, engine="streaming")
+    else:
+        # older Polars: stream the query, then slice the result
+        yield from lf.collect(engine="streaming").iter_slices(n_rows=batch_size)
 
-        conn = psycopg2.connect(**DATABASE_CONFIG)
-        cursor = conn.cursor()
+def copy_dataframe_to_db(df: pl.DataFrame, table_name: str, conn, batch_size: int = COPY_BATCH_SIZE):
+    """Bulk loads a DataFrame with COPY ... FROM STDIN, one CSV batch at a time."""
+    return copy_batches_to_db(df.iter_slices(n_rows=batch_size), df.columns, table_name, conn)
 
-        # # Assuming the table schema matches the DataFrame's columns
+def copy_batches_to_db(batches, columns: list, table_name: str, conn, schema: str = SCHEMA):
+    """Runs one COPY ... FROM STDIN per DataFrame batch and logs the load rate."""
+    cols = ", ".join([f'"{col}"' for col in columns])
+    copy_query = f'COPY {schema}."{table_name}" ({cols}) FROM STDIN WITH (FORMAT csv)'
 
+    rows = 0
+    start = time.perf_counter()
+    with conn.cursor() as cursor:
+        for batch in batches:
+            # Polars writes nulls as unquoted empty fields, which COPY reads back as NULL
+            buffer = io.BytesIO()
+            batch.write_csv(buffer, include_header=False)
+            buffer.seek(0)
+            cursor.copy_expert(copy_query, buffer)
+            rows += batch.height
 
-        # Properly format column names for the SQL query
-        cols = ", ".join([f'"{col}"' for col in df.columns])
-        placeholders = ", ".join(["%s"] * len(df.columns))
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed if elapsed > 0 else float(rows)
+    logger.info(f"Copied {rows} rows into {schema}.{table_name} in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+    return rows
 
-        query = f"""
-        INSERT INTO {SCHEMA}."{table_name}" ({cols})
-        VALUES ({placeholders})
-        """
+def ensure_key_index(table_name: str, key_columns: list, conn, unique: bool = False):
+    """Creates the index an upsert needs on the key columns, if it is missing."""
+    index_name = f'{table_name}_{"_".join(key_columns)}_{"key" if unique else "idx"}'
+    keys = ", ".join([f'"{col}"' for col in key_columns])
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f'CREATE {"UNIQUE " if unique else ""}INDEX IF NOT EXISTS "{index_name}" '
+            f'ON {SCHEMA}."{table_name}" ({keys})'
+        )
 
-        for record in records:
-            cursor.execute(query, tuple(record.values()))
+def upsert_from_staging(df: pl.DataFrame, table_name: str, key_columns: list, conn,
+                        batch_size: int = COPY_BATCH_SIZE, strategy: str = UPSERT_STRATEGY):
+    """
+    Merges a DataFrame into SCHEMA.table_name on key_columns in one set-based statement.
+    The frame is copied into a temporary staging table first, then:
+    - strategy="delete_insert": target rows sharing a key with the staging rows are
+      deleted and every staging row is inserted (safe for detail tables, whose keys repeat);
+      during a bulk load the key index is left to finish_bulk_load
+    - strategy="on_conflict": INSERT ... ON CONFLICT (keys) DO UPDATE, which needs the
+      keys to be unique; a unique index is created on them when missing
+    """
+    columns = df.collect_schema().names()
+    cols = ", ".join([f'"{col}"' for col in columns])
+    keys = ", ".join([f'"{col}"' for col in key_columns])
+    staging_table = f"staging_{table_name}"
 
-        conn.commit()
-        cursor.close()
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TEMP TABLE "{staging_table}" (LIKE {SCHEMA}."{table_name}" INCLUDING DEFAULTS) ON COMMIT DROP'
+        )
 
-    except Exception as e:
-        if conn:
-            conn.rollback()
-        logger.error(f"Error inserting DataFrame into DB: {e}")
-    finally:
-        if conn:
-            conn.close()
+    if isinstance(df, pl.LazyFrame):
+        rows = copy_batches_to_db(iter_lazy_batches(df, batch_size), columns, staging_table, conn, "pg_temp")
+    else:
+        rows = copy_batches_to_db(df.iter_slices(n_rows=batch_size), columns, staging_table, conn, "pg_temp")
+
+    with conn.cursor() as cursor:
+        if strategy == "on_conflict":
+            ensure_key_index(table_name, key_columns, conn, unique=True)
+            updates = ", ".join([f'"{col}" = EXCLUDED."{col}"' for col in columns if col not in key_columns])
+            conflict_action = f"DO UPDATE SET {updates}" if updates else "DO NOTHING"
+            cursor.execute(f"""
+            INSERT INTO {SCHEMA}."{table_name}" ({cols})
+            SELECT DISTINCT ON ({keys}) {cols} FROM pg_temp."{staging_table}"
+            ON CONFLICT ({keys}) {conflict_action}
+            """)
+        else:
+            if not bulk_load_active.is_set():
+                ensure_key_index(table_name, key_columns, conn)
+            matches = " AND ".join([f'target."{col}" = staged."{col}"' for col in key_columns])
+            cursor.execute(f"""
+            DELETE FROM {SCHEMA}."{table_name}" AS target
+            USING (SELECT DISTINCT {keys} FROM pg_temp."{staging_table}") AS staged
+            WHERE {matches}
+            """)
+            logger.info(f"Replaced {cursor.rowcount} existing rows in {SCHEMA}.{table_name}")
+            cursor.execute(f"""
+            INSERT INTO {SCHEMA}."{table_name}" ({cols})
+            SELECT {cols} FROM pg_temp."{staging_table}"
+            """)
+
+    logger.info(f"Upserted {rows} rows into {SCHEMA}.{table_name} on ({', '.join(key_columns)})")
+    return rows
+
+def ensure_index_backup_table(conn):
+    """Table keeping the definitions of indexes dropped for a bulk load until they are rebuilt."""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}."{BULK_LOAD_INDEX_TABLE}" (
+            index_name TEXT PRIMARY KEY,
+            table_name TEXT,
+            definition TEXT,
+            dropped_at TIMESTAMP DEFAULT now()
+        );
+        """)
+
+def saved_index_definitions() -> dict:
+    """{index name: definition} of indexes dropped by a bulk load and not rebuilt yet."""
+    with db_session() as conn:
+        ensure_index_backup_table(conn)
+        with conn.cursor() as cursor:
+            cursor.execute(f'SELECT index_name, definition FROM {SCHEMA}."{BULK_LOAD_INDEX_TABLE}"')
+            return dict(cursor.fetchall())
+
+def prepare_bulk_load(table_names) -> dict:
+    """
+    Drops the non-unique indexes of the tables about to be loaded, so COPY does not
+    maintain them row by row. Unique indexes and constraints are kept (upserts rely on them),
+    and so are indexes leading with DBKey, which the per-DIMA deletes of reloads and
+    delete_insert upserts need. The definitions are saved in BULK_LOAD_INDEX_TABLE in the
+    same transaction as the drops, so an interrupted run does not lose them.
+    Returns {index name: index definition} for finish_bulk_load to restore.
+    Until then upserts do not create their non-unique key index either.
+    """
+    bulk_load_active.set()
+    with db_session() as conn:
+        ensure_index_backup_table(conn)
+        with conn.cursor() as cursor:
+            cursor.execute("""
+            SELECT index_class.relname, table_class.relname, pg_get_indexdef(idx.indexrelid)
+            FROM pg_index idx
+            JOIN pg_class index_class ON index_class.oid = idx.indexrelid
+            JOIN pg_class table_class ON table_class.oid = idx.indrelid
+            JOIN pg_namespace ns ON ns.oid = table_class.relnamespace
+            WHERE ns.nspname = %s AND table_class.relname = ANY(%s)
+              AND NOT idx.indisunique AND NOT idx.indisprimary
+              AND pg_get_indexdef(idx.indexrelid, 1, true) NOT IN ('"DBKey"', 'DBKey')
+            """, (SCHEMA, list(table_names)))
+            indexes = cursor.fetchall()
+            for index_name, table_name, definition in indexes:
+                cursor.execute(f"""
+                INSERT INTO {SCHEMA}."{BULK_LOAD_INDEX_TABLE}" (index_name, table_name, definition)
+                VALUES (%s, %s, %s)
+                ON CONFLICT (index_name) DO UPDATE SET definition = EXCLUDED.definition
+                """, (index_name, table_name, definition))
+                cursor.execute(f'DROP INDEX IF EXISTS {SCHEMA}."{index_name}"')
+
+    logger.info(f"Dropped {len(indexes)} secondary indexes before bulk load")
+    return {index_name: definition for index_name, _, definition in indexes}
+
+def build_index(statement: str, label: str, saved: bool = False):
+    """
+    Runs one CREATE INDEX in its own pooled session; saved forgets the definition
+    prepare_bulk_load kept for it in the same transaction.
+    """
+    start = time.perf_counter()
+    with db_session() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(statement)
+            if saved:
+                cursor.execute(f'DELETE FROM {SCHEMA}."{BULK_LOAD_INDEX_TABLE}" WHERE index_name = %s', (label,))
+    logger.info(f"Built index {label} in {time.perf_counter() - start:.2f}s")
+
+def finish_bulk_load(index_plan: dict, dropped: dict = None, max_workers: int = INDEX_BUILD_WORKERS):
+    """
+    Rebuilds indexes after a bulk load: the column sets in index_plan
+    ({table name: [columns, ...]}) that exist on each table, plus the indexes
+    prepare_bulk_load dropped (this run's and any an interrupted run left in
+    BULK_LOAD_INDEX_TABLE), built in parallel; then one ANALYZE of the loaded tables.
+    Called once every load has finished; with an empty index_plan it only restores
+    the saved indexes.
+    """
+    bulk_load_active.clear()
+    with db_session() as conn:
+        table_columns = {table: table_catalog.columns(table, conn) for table in index_plan}
+
+    statements = {}
+    for table_name, index_sets in index_plan.items():
+        existing = table_columns.get(table_name)
+        if existing is None:
+            continue
+        for columns in index_sets:
+            if not all(col in existing for col in columns):
+                continue
+            index_name = f'{table_name}_{"_".join(columns)}_idx'
+            keys = ", ".join([f'"{col}"' for col in columns])
+            statements[index_name] = f'CREATE INDEX IF NOT EXISTS "{index_name}" ON {SCHEMA}."{table_name}" ({keys})'
+    saved = {**saved_index_definitions(), **(dropped or {})}
+    for index_name, definition in saved.items():
+        if index_name not in statements:
+            statements[index_name] = definition.replace("CREATE INDEX", "CREATE INDEX IF NOT EXISTS", 1)
+    if not statements and not index_plan:
+        return
+
+    start = time.perf_counter()
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(build_index, statement, index_name, index_name in saved): index_name for index_name, statement in statements.items()}
+        for future, index_name in futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                logger.error(f"Failed to build index {index_name}: {e}")
+    logger.info(f"Built {len(statements) - failed} of {len(statements)} indexes in {time.perf_counter() - start:.2f}s")
+
+    loaded_tables = [table for table, columns in table_columns.items() if columns is not None]
+    if loaded_tables:
+        tables_sql = ", ".join(f'{SCHEMA}."{table}"' for table in loaded_tables)
+        try:
+            with db_session() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"ANALYZE {tables_sql}")
+            logger.info(f"Analyzed {len(loaded_tables)} tables")
+        except Exception as e:
+            logger.error(f"ANALYZE failed: {e}")
+
+def insert_rows_to_db(df: pl.DataFrame, table_name: str, conn):
+    """Legacy row-by-row INSERT path."""
+    # Properly format column names for the SQL query
+    cols = ", ".join([f'"{col}"' for col in df.columns])
+    placeholders = ", ".join(["%s"] * len(df.columns))
+
+    query = f"""
+    INSERT INTO {SCHEMA}."{table_name}" ({cols})
+    VALUES ({placeholders})
+    """
+
+    with conn.cursor() as cursor:
+        for record in df.iter_rows():
+            cursor.execute(query, record)
+    return df.height
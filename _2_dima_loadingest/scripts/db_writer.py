@@ -0,0 +1,102 @@
+import logging
+import queue
+import threading
+from collections import defaultdict
+from _2_dima_loadingest.config import DB_WRITER_WORKERS, DB_WRITER_QUEUE_SIZE
+from _2_dima_loadingest.scripts.metrics import pipeline_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class DBWriter:
+    """
+    Background writer stage: a bounded queue drained by a few writer threads, so
+    parsing and joining the next file overlaps the COPY of the previous one.
+    submit() blocks while the queue is full (backpressure), which also bounds how
+    many finished frames wait in memory. Each task returns the rows it loaded
+    (None on failure); results and errors are collected per table for close().
+    """
+
+    def __init__(self, workers: int = DB_WRITER_WORKERS, queue_size: int = DB_WRITER_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self._queue = None
+        self._threads = []
+        self._lock = threading.Lock()
+        self.loaded = defaultdict(int)
+        self.failures = defaultdict(list)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def start(self):
+        """Starts the writer threads; called once at the start of a run."""
+        if self.running:
+            return
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self.loaded = defaultdict(int)
+        self.failures = defaultdict(list)
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"db-writer-{i}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"Started {self.workers} DB writer threads (queue size {self.queue_size})")
+
+    def submit(self, table_name: str, write, label: str = None, context: tuple = (None, None, None)):
+        """
+        Queues write() for a writer thread; blocks while the queue is full.
+        label names the load in error reports (e.g. the file name), context is the
+        (source, data_type, table_type) its metrics are recorded under.
+        """
+        if self._queue.full():
+            with pipeline_metrics.context(*context), pipeline_metrics.stage("db_writer_wait"):
+                self._queue.put((table_name, write, label, context))
+        else:
+            self._queue.put((table_name, write, label, context))
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                table_name, write, label, context = item
+                try:
+                    with pipeline_metrics.context(*context):
+                        rows = write()
+                    error = None if rows is not None else "load failed, see the log above"
+                except Exception as e:
+                    rows, error = None, str(e)
+
+                with self._lock:
+                    if error is None:
+                        self.loaded[table_name] += rows
+                    else:
+                        self.failures[table_name].append((label, error))
+                if error is not None:
+                    logger.error(f"DB writer failed to load {label or table_name} into {table_name}: {error}")
+            finally:
+                self._queue.task_done()
+
+    def close(self) -> dict:
+        """Waits for every queued write, stops the threads and logs the per-table results."""
+        if not self.running:
+            return {}
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        for table_name, rows in sorted(self.loaded.items()):
+            logger.info(f"DB writer loaded {rows} rows into {table_name}")
+        for table_name, failures in sorted(self.failures.items()):
+            labels = ", ".join(label or "?" for label, _ in failures)
+            logger.error(f"DB writer: {len(failures)} failed loads into {table_name}: {labels}")
+        return dict(self.failures)
+
+
+db_writer = DBWriter()
@@ -0,0 +1,100 @@
+import polars as pl
+import logging
+import os, os.path
+import threading
+from collections import OrderedDict
+from _2_dima_loadingest.config import FRAME_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCache:
+    """
+    Run-scoped, memory-bounded LRU cache for parsed/joined DataFrames.
+    Entries are keyed by a name plus the (path, mtime) of every source file,
+    so a file that changes on disk is parsed again. Least recently used
+    frames are evicted once the estimated size exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes: int = FRAME_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._frames = OrderedDict()
+        self._sizes = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        # one lock per key so parallel workers wait for a frame instead of parsing it twice
+        self._key_locks = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(name, paths):
+        return (name,) + tuple((os.path.abspath(p), os.stat(p).st_mtime_ns) for p in paths)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._frames:
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return self._frames[key]
+
+    def put(self, key, df: pl.DataFrame):
+        size = df.estimated_size()
+        with self._lock:
+            if key in self._frames:
+                self._total_bytes -= self._sizes[key]
+            self._frames[key] = df
+            self._frames.move_to_end(key)
+            self._sizes[key] = size
+            self._total_bytes += size
+
+            # evict least recently used frames, always keeping the newest one
+            while self._total_bytes > self.max_bytes and len(self._frames) > 1:
+                old_key, _ = self._frames.popitem(last=False)
+                self._total_bytes -= self._sizes.pop(old_key)
+                logger.debug(f"Evicted {old_key[0]} {old_key[1:]} from frame cache")
+
+    def get_or_compute(self, name, paths, compute):
+        """Returns the cached frame for (name, paths) or builds it once with compute()."""
+        key = self.make_key(name, paths)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            df = self.get(key)
+            if df is not None:
+                return df
+            with self._lock:
+                self.misses += 1
+            df = compute()
+            if df is not None:
+                self.put(key, df)
+            return df
+
+    def get_or_load(self, path, reader):
+        """Returns the cached parse of path or reads it once with reader(path)."""
+        return self.get_or_compute("read", [path], lambda: reader(path))
+
+    def peek(self, path):
+        """Returns the cached parse of path without loading it on a miss."""
+        try:
+            return self.get(self.make_key("read", [path]))
+        except OSError:
+            return None
+
+    def clear(self):
+        with self._lock:
+            if self._frames or self.hits or self.misses:
+                logger.info(f"Frame cache: {self.hits} hits, {self.misses} misses, "
+                            f"{self._total_bytes / 1024 ** 2:.1f} MiB held at clear")
+            self._frames.clear()
+            self._sizes.clear()
+            self._key_locks.clear()
+            self._total_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+
+# cache shared by the whole ingest run, cleared when do_ingest finishes
+frame_cache = FrameCache()
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import logging
+import os, os.path
+import tempfile
+import threading
+from datetime import datetime
+from _2_dima_loadingest.config import SCHEMA, MANIFEST_BACKEND, MANIFEST_PATH, MANIFEST_TABLE, OUTPUT_SINKS
+from _2_dima_loadingest.scripts.db_connector import db_session
+
+logger = logging.getLogger(__name__)
+
+
+def file_hash(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Content hash of a file, read in chunks."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def entry_sinks(entry: dict) -> list:
+    """Sinks holding a manifest entry's content; entries from before output sinks were all loaded into postgres."""
+    return entry.get("sinks") or ["postgres"]
+
+
+class IngestManifest:
+    """
+    Records what each ingest run loaded: content hash, row count, load time and the
+    output sinks that hold that content, for every extracted file and its (source, table).
+    Stored as a local JSON file (backend="file") or in SCHEMA.MANIFEST_TABLE (backend="table").
+    """
+
+    def __init__(self, backend: str = MANIFEST_BACKEND, path: str = MANIFEST_PATH):
+        self.backend = backend
+        self.path = path
+        self.entries = {}
+        # hashes computed while filtering, reused when the file is recorded
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        """Reads the stored manifest; called once at the start of a run."""
+        self.entries = {}
+        self._hashes = {}
+        self._loaded = True
+        try:
+            if self.backend == "table":
+                self.entries = self._load_table()
+            elif os.path.exists(self.path):
+                with open(self.path) as manifest_file:
+                    self.entries = json.load(manifest_file)
+            logger.info(f"Loaded ingest manifest with {len(self.entries)} entries ({self.backend})")
+        except Exception as e:
+            logger.error(f"Failed to load ingest manifest, treating every file as new: {e}")
+
+    def changed_files(self, file_names: list, data_dir: str, sinks: list = OUTPUT_SINKS) -> list:
+        """
+        Returns the files that are new, whose content changed since they were last loaded,
+        or that one of sinks has not loaded yet.
+        """
+        changed = []
+        for file_name in file_names:
+            content_hash = file_hash(os.path.join(data_dir, file_name))
+            self._hashes[file_name] = content_hash
+
+            entry = self.entries.get(file_name)
+            if entry is not None and entry["content_hash"] == content_hash and set(sinks) <= set(entry_sinks(entry)):
+                logger.info(f"Skipping unchanged file: {file_name}")
+            else:
+                changed.append(file_name)
+
+        logger.info(f"{len(changed)} of {len(file_names)} files are new or changed")
+        return changed
+
+    def loaded_before(self, file_name: str) -> bool:
+        """
+        True when the manifest has a previous load of the file's table, in any extracted
+        format (X.csv or its converted X.parquet); a reload replaces those rows.
+        """
+        stem = os.path.splitext(file_name)[0]
+        with self._lock:
+            return any(os.path.splitext(name)[0] == stem for name in self.entries)
+
+    def record(self, file_name: str, file_path: str, source: str, table_name: str, row_count: int,
+               sinks: list = OUTPUT_SINKS):
+        """
+        Stores the load of one file by sinks. Sinks that loaded the same content earlier
+        are kept, so a file written to each sink in a different run counts as loaded in both.
+        """
+        content_hash = self._hashes.pop(file_name, None) or file_hash(file_path)
+        entry = {
+            "source": source,
+            "table_name": table_name,
+            "content_hash": content_hash,
+            "row_count": row_count,
+            "loaded_at": datetime.now().isoformat(timespec="seconds"),
+            "sinks": sorted(sinks),
+        }
+        with self._lock:
+            if not self._loaded:
+                self.load()
+            previous = self.entries.get(file_name)
+            if previous is not None and previous["content_hash"] == content_hash:
+                entry["sinks"] = sorted(set(sinks) | set(entry_sinks(previous)))
+            self._store(file_name, entry)
+
+    def carry_over(self, source_path: str, output_path: str):
+        """
+        Records a columnar file converted from an already loaded CSV as loaded too, when the
+        CSV is unchanged since that load, so `convert` does not make every table look new.
+        """
+        source_name, output_name = os.path.basename(source_path), os.path.basename(output_path)
+        with self._lock:
+            if not self._loaded:
+                self.load()
+            entry = self.entries.get(source_name)
+            if entry is None or entry["content_hash"] != file_hash(source_path):
+                return
+            self._store(output_name, {**entry, "content_hash": file_hash(output_path)})
+
+    def _store(self, file_name, entry):
+        # called with self._lock held
+        self.entries[file_name] = entry
+        try:
+            if self.backend == "table":
+                self._record_table(file_name, entry)
+            else:
+                self._save_file()
+        except Exception as e:
+            logger.error(f"Failed to record {file_name} in ingest manifest: {e}")
+
+    def _save_file(self):
+        """Writes the manifest to a temporary file and swaps it in, so a crash never leaves it half written."""
+        manifest_dir = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(manifest_dir, exist_ok=True)
+        fd, partial_path = tempfile.mkstemp(dir=manifest_dir, prefix=".manifest-", suffix=".partial")
+        try:
+            with os.fdopen(fd, "w") as manifest_file:
+                json.dump(self.entries, manifest_file, indent=2, sort_keys=True)
+            os.replace(partial_path, self.path)
+        except Exception:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+    def _ensure_table(self, conn):
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SCHEMA}."{MANIFEST_TABLE}" (
+                file_name TEXT PRIMARY KEY,
+                source TEXT,
+                table_name TEXT,
+                content_hash TEXT,
+                row_count BIGINT,
+                loaded_at TIMESTAMP,
+                sinks TEXT
+            );
+            ALTER TABLE {SCHEMA}."{MANIFEST_TABLE}" ADD COLUMN IF NOT EXISTS sinks TEXT;
+            """)
+
+    def _load_table(self):
+        with db_session() as conn:
+            self._ensure_table(conn)
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                SELECT file_name, source, table_name, content_hash, row_count, loaded_at, sinks
+                FROM {SCHEMA}."{MANIFEST_TABLE}"
+                """)
+                rows = cursor.fetchall()
+        return {
+            file_name: {
+                "source": source,
+                "table_name": table_name,
+                "content_hash": content_hash,
+                "row_count": row_count,
+                "loaded_at": loaded_at.isoformat() if loaded_at else None,
+                "sinks": sinks.split(",") if sinks else None,
+            }
+            for file_name, source, table_name, content_hash, row_count, loaded_at, sinks in rows
+        }
+
+    def _record_table(self, file_name, entry):
+        with db_session() as conn:
+            self._ensure_table(conn)
+            with conn.cursor() as cursor:
+                cursor.execute(f"""
+                INSERT INTO {SCHEMA}."{MANIFEST_TABLE}"
+                    (file_name, source, table_name, content_hash, row_count, loaded_at, sinks)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (file_name) DO UPDATE SET
+                    source = EXCLUDED.source,
+                    table_name = EXCLUDED.table_name,
+                    content_hash = EXCLUDED.content_hash,
+                    row_count = EXCLUDED.row_count,
+                    loaded_at = EXCLUDED.loaded_at,
+                    sinks = EXCLUDED.sinks
+                """, (
+                    file_name, entry["source"], entry["table_name"],
+                    entry["content_hash"], entry["row_count"], entry["loaded_at"],
+                    ",".join(entry_sinks(entry)),
+                ))
+
+
+ingest_manifest = IngestManifest()
@@ -0,0 +1,196 @@
+import polars as pl
+import functools
+import json
+import logging
+import os, os.path
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from _2_dima_loadingest.config import METRICS_ENABLED, METRICS_PATH
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of the process so far, or None where getrusage is unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def frame_rows(value):
+    """Row count of a DataFrame result, or the value itself for functions returning a row count."""
+    if isinstance(value, pl.DataFrame):
+        return value.height
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    return None
+
+
+class PipelineMetrics:
+    """
+    Per-stage measurements for an ingest run: wall time, rows in/out, bytes read and
+    peak RSS, keyed by the (source, data_type, table_type) being processed.
+    The table context is thread-local, so parallel workers record their own tables.
+    Peak RSS is process-wide (ru_maxrss): with several workers it shows the run's
+    high-water mark when the stage finished, not the stage's own allocation.
+    Records are kept for the end-of-run summary and, with path set, appended to a
+    JSON-lines file as they are taken.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED, path: str = METRICS_PATH):
+        self.enabled = enabled
+        self.path = path
+        self.records = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        with self._lock:
+            self.records = []
+
+    def current_context(self):
+        return getattr(self._local, "context", (None, None, None))
+
+    @contextmanager
+    def context(self, source=None, data_type=None, table_type=None):
+        """Sets the (source, data_type, table_type) nested stages are recorded under."""
+        previous = self.current_context()
+        self._local.context = (source, data_type, table_type)
+        try:
+            yield
+        finally:
+            self._local.context = previous
+
+    @contextmanager
+    def stage(self, name: str, **fields):
+        """
+        Times the block and records it; the yielded dict takes rows_in, rows_out
+        and bytes_read from the caller.
+        """
+        record = {"stage": name, **fields}
+        if not self.enabled:
+            yield record
+            return
+
+        source, data_type, table_type = self.current_context()
+        peak_before = peak_rss_bytes()
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            peak_after = peak_rss_bytes()
+            record.update(
+                source=source,
+                data_type=data_type,
+                table_type=table_type,
+                seconds=round(time.perf_counter() - start, 6),
+                peak_rss_bytes=peak_after,
+                peak_rss_growth_bytes=(peak_after - peak_before) if peak_after is not None else None,
+            )
+            self._add(record)
+
+    def _add(self, record):
+        with self._lock:
+            self.records.append(record)
+            if self.path:
+                try:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    with open(self.path, "a") as metrics_file:
+                        metrics_file.write(json.dumps(record) + "\n")
+                except Exception as e:
+                    logger.error(f"Failed to write metrics to {self.path}: {e}")
+
+    def summary(self) -> dict:
+        """Totals per stage and per (source, data_type, table_type) and stage."""
+        with self._lock:
+            records = list(self.records)
+
+        def totals():
+            return {"calls": 0, "seconds": 0.0, "rows_in": 0, "rows_out": 0, "bytes_read": 0}
+
+        by_stage = defaultdict(totals)
+        by_table = defaultdict(lambda: defaultdict(totals))
+        for record in records:
+            table = (record["source"], record["data_type"], record["table_type"])
+            for entry in (by_stage[record["stage"]], by_table[table][record["stage"]]):
+                entry["calls"] += 1
+                entry["seconds"] += record["seconds"]
+                for field in ("rows_in", "rows_out", "bytes_read"):
+                    entry[field] += record.get(field) or 0
+
+        return {
+            "stages": dict(by_stage),
+            "tables": {table: dict(stages) for table, stages in by_table.items()},
+            "peak_rss_bytes": max((r["peak_rss_bytes"] or 0 for r in records), default=None),
+        }
+
+    def log_summary(self, top: int = 10):
+        """Logs stage totals and the slowest tables at the end of a run."""
+        if not self.enabled or not self.records:
+            return
+        summary = self.summary()
+        logger.info("Ingest stage summary:")
+        for stage, entry in sorted(summary["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            logger.info(
+                f"  {stage:30s} {entry['calls']:6d} calls {entry['seconds']:10.2f}s "
+                f"rows in {entry['rows_in']:>12,} out {entry['rows_out']:>12,} "
+                f"read {entry['bytes_read'] / 1024 ** 2:10.1f} MiB"
+            )
+
+        slowest = sorted(
+            summary["tables"].items(),
+            key=lambda item: -sum(entry["seconds"] for entry in item[1].values()),
+        )[:top]
+        logger.info(f"Slowest tables (top {len(slowest)}):")
+        for (source, data_type, table_type), stages in slowest:
+            breakdown = ", ".join(
+                f"{stage} {entry['seconds']:.2f}s"
+                for stage, entry in sorted(stages.items(), key=lambda item: -item[1]["seconds"])
+            )
+            logger.info(f"  {source} {data_type} {table_type or '-'}: {breakdown}")
+
+        if summary["peak_rss_bytes"]:
+            logger.info(f"Peak RSS: {summary['peak_rss_bytes'] / 1024 ** 2:.1f} MiB")
+
+
+pipeline_metrics = PipelineMetrics()
+
+
+def instrument(stage_name: str = None, context=None, reads_file: bool = False):
+    """
+    Decorator recording each call of a pipeline function as a stage.
+    rows_in is taken from the first DataFrame argument, rows_out from a DataFrame or
+    row-count result; reads_file records the size of the first (path) argument.
+    context(*args, **kwargs) may return the (source, data_type, table_type) the call
+    and its nested stages belong to.
+    """
+    def decorator(func):
+        name = stage_name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not pipeline_metrics.enabled:
+                return func(*args, **kwargs)
+
+            table = context(*args, **kwargs) if context else pipeline_metrics.current_context()
+            with pipeline_metrics.context(*table), pipeline_metrics.stage(name) as record:
+                frame = next((a for a in args if isinstance(a, pl.DataFrame)), None)
+                if frame is not None:
+                    record["rows_in"] = frame.height
+                if reads_file and args and isinstance(args[0], str) and os.path.exists(args[0]):
+                    record["bytes_read"] = os.path.getsize(args[0])
+                result = func(*args, **kwargs)
+                record["rows_out"] = frame_rows(result)
+                return result
+
+        return wrapper
+    return decorator
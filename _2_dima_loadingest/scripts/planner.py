@@ -0,0 +1,200 @@
+import logging
+import os, os.path
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from graphlib import TopologicalSorter
+from _2_dima_loadingest.config import (
+    DATA_DIR,
+    INGEST_WORKERS,
+    LAZY_INGEST,
+    fulljoin_key,
+    lineplotjoin_key,
+)
+from _2_dima_loadingest.scripts.data_loader import (
+    process_csv,
+    process_csv_lazy,
+    create_pksource_per_datatype,
+)
+from _2_dima_loadingest.scripts.columnar import select_ingest_files
+from _2_dima_loadingest.scripts.metrics import pipeline_metrics
+from _2_dima_loadingest.scripts.sinks import configure_sinks, sink_names
+from _2_dima_loadingest.scripts.utils import (
+    classify_table,
+    clear_unit,
+    release_pksource,
+    list_source_files,
+    load_lines_plots,
+)
+
+logger = logging.getLogger(__name__)
+
+"""
+Dependency-aware ingest planning.
+
+Every file is classified once and the run is laid out as a DAG:
+    ("lines_plots", source)            Lines-Plots join of a source DIMA
+    ("pksource", source, data_type)    header/detail (or stack/box/pit) ⋈ Lines-Plots
+    ("file", file_name)                load, PrimaryKey join and flush of one table
+The edges come from the join mappings in config: a table needs its unit's pksource
+when fulljoin_key joins it, and a pksource needs its source's Lines-Plots join when
+lineplotjoin_key names its key. pksources are built from the files on disk, so tables of one unit do
+not wait for each other and run in parallel once their pksource exists.
+"""
+
+
+def build_plan(file_names: list, data_dir: str = DATA_DIR) -> tuple:
+    """
+    Returns (plan, source_files): plan maps each node to the set of nodes it depends on,
+    source_files maps each source DIMA to its file names. The data directory is listed
+    once here and the lists are handed to the pksource nodes instead of re-listing it.
+    """
+    source_files = defaultdict(list)
+    for file_name in list_source_files(data_dir):
+        source_files[file_name.split("_", 1)[0]].append(file_name)
+
+    plan = {}
+    for file_name in file_names:
+        source, data_type, table_type = classify_table(file_name)
+        if not source or not data_type or not table_type:
+            logger.warning(f"Skipping {file_name}: Unable to classify table.")
+            continue
+
+        file_node = ("file", file_name)
+        plan[file_node] = set()
+        if table_type not in fulljoin_key.get(data_type, {}):
+            continue
+
+        pksource_node = ("pksource", source, data_type)
+        plan.setdefault(pksource_node, set())
+        plan[file_node].add(pksource_node)
+        if data_type in lineplotjoin_key:
+            lines_plots_node = ("lines_plots", source)
+            plan.setdefault(lines_plots_node, set())
+            plan[pksource_node].add(lines_plots_node)
+
+    return plan, dict(source_files)
+
+# table types whose files feed their unit's pksource (see find_and_load_files)
+PKSOURCE_TABLE_TYPES = {"Header", "Detail", "Stack", "TrapCollection", "Box", "BoxCollection", "Pits", "PitHorizons"}
+
+def affected_files(changed: list, file_names: list) -> list:
+    """
+    Expands the changed files of an incremental run to every file of file_names whose
+    PrimaryKeys they feed, following the plan's edges upstream of the file nodes:
+    - a changed Lines/Plots file changes the source's Lines-Plots join, so every file of a
+      unit whose pksource joins it (lineplotjoin_key) is reloaded
+    - a changed pksource input (header/detail, stack/trap, box, pit files) reloads every file
+      of its unit; tblGap header/detail also feed the Base pksource
+    """
+    changed = set(changed)
+    sources, units = set(), set()
+    for file_name in changed:
+        source, data_type, table_type = classify_table(file_name)
+        if data_type == "Base":
+            sources.add(source)
+        elif data_type in lineplotjoin_key and table_type in PKSOURCE_TABLE_TYPES:
+            units.add((source, data_type))
+            if data_type == "tblGap":
+                units.add((source, "Base"))
+
+    expanded = []
+    for file_name in file_names:
+        source, data_type, _ = classify_table(file_name)
+        if (file_name in changed or (source, data_type) in units
+                or (source in sources and data_type in lineplotjoin_key)):
+            expanded.append(file_name)
+    if len(expanded) > len(changed):
+        logger.info(f"Reloading {len(expanded) - len(changed)} unchanged files whose PrimaryKeys depend on changed files")
+    return expanded
+
+def plan_stages(plan: dict) -> list:
+    """Groups the plan into stages; every node in a stage only depends on earlier stages."""
+    sorter = TopologicalSorter(plan)
+    sorter.prepare()
+    stages = []
+    while sorter.is_active():
+        stage = sorted(sorter.get_ready())
+        stages.append(stage)
+        sorter.done(*stage)
+    return stages
+
+def node_label(node) -> str:
+    kind, *rest = node
+    return f"{kind} {' '.join(rest)}"
+
+def format_plan(plan: dict) -> str:
+    """Readable schedule for the `plan` command."""
+    lines = []
+    for index, stage in enumerate(plan_stages(plan), start=1):
+        lines.append(f"Stage {index} ({len(stage)} tasks):")
+        lines.extend(f"  {node_label(node)}" for node in stage)
+    return "\n".join(lines)
+
+def run_node(node, source_files: dict, lazy: bool = LAZY_INGEST):
+    """Executes one plan node."""
+    kind = node[0]
+    if kind == "lines_plots":
+        source = node[1]
+        with pipeline_metrics.context(source, "Base", None):
+            load_lines_plots(DATA_DIR, source, source_files.get(source, []))
+    elif kind == "pksource":
+        _, source, data_type = node
+        create_pksource_per_datatype(data_type, source, source_files.get(source, []))
+    else:
+        # classified once here; the file's stages are recorded under its table
+        table = classify_table(node[1])
+        with pipeline_metrics.context(*table):
+            if lazy:
+                process_csv_lazy(node[1], table=table)
+            else:
+                process_csv(node[1], table=table)
+
+def run_plan(plan: dict, source_files: dict, max_workers: int = INGEST_WORKERS, lazy: bool = LAZY_INGEST):
+    """
+    Runs the plan in topological order on a thread pool, submitting each node as soon
+    as its dependencies finish. A failed node is logged and its dependents still run,
+    as they do in process_csv (tables without a pksource are held and reported).
+    A unit's pksource is released as soon as the last of its file nodes finished.
+    """
+    sorter = TopologicalSorter(plan)
+    sorter.prepare()
+    # file nodes still to run per pksource node
+    pending_files = defaultdict(int)
+    for node, dependencies in plan.items():
+        if node[0] == "file":
+            for dependency in dependencies:
+                pending_files[dependency] += 1
+    logger.info(f"Running ingest plan with {len(plan)} tasks on {max_workers} workers")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        while sorter.is_active():
+            for node in sorter.get_ready():
+                running[executor.submit(run_node, node, source_files, lazy)] = node
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node = running.pop(future)
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Error running {node_label(node)}: {e}")
+                sorter.done(node)
+                if node[0] == "file":
+                    for dependency in plan[node]:
+                        pending_files[dependency] -= 1
+                        if pending_files[dependency] == 0:
+                            release_pksource(*dependency[1:])
+
+def reprocess_unit(source, data_type, data_dir: str = DATA_DIR, lazy: bool = LAZY_INGEST):
+    """Discards one (source, data_type) unit and runs its files through a plan of their own."""
+    clear_unit(source, data_type)
+    file_names = [
+        f for f in select_ingest_files(os.listdir(data_dir), data_dir)
+        if classify_table(f)[:2] == (source, data_type)
+    ]
+    logger.info(f"Re-processing {len(file_names)} files for {source} {data_type}")
+    if not sink_names():
+        configure_sinks()
+    plan, source_files = build_plan(file_names, data_dir)
+    run_plan(plan, source_files, lazy=lazy)
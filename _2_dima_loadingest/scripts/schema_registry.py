@@ -0,0 +1,201 @@
+import polars as pl
+import json
+import logging
+import os, os.path
+import threading
+from _2_dima_loadingest.config import (
+    CSV_NULL_VALUES,
+    SCHEMA_REGISTRY_MODE,
+    SCHEMA_REGISTRY_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+"""
+Explicit column types for extracted DIMA tables.
+
+Every CSV is read with a full schema, so Polars never runs an inference pass
+and the same column always gets the same type whichever DIMA it came from.
+Types are resolved per column in this order:
+1. learned types persisted in SCHEMA_REGISTRY_PATH
+2. the built-in definitions below
+3. key/date naming rules (always text; dates are parsed later by format_dates)
+4. "learn" mode: inferred once from the first file and persisted,
+   "builtin" mode: read as text
+"""
+
+# dtype names used in the persisted registry file
+DTYPES = {
+    "String": pl.String,
+    "Int64": pl.Int64,
+    "Float64": pl.Float64,
+}
+
+# numeric columns whose type is fixed by the DIMA schema
+BUILTIN_SCHEMAS = {
+    "tblPlots": {
+        "Elevation": pl.Float64,
+        "Slope": pl.Float64,
+        "Aspect": pl.String,
+        "Easting": pl.Float64,
+        "Northing": pl.Float64,
+        "Latitude": pl.Float64,
+        "Longitude": pl.Float64,
+    },
+    "tblLines": {
+        "Azimuth": pl.Float64,
+        "NorthingStart": pl.Float64,
+        "EastingStart": pl.Float64,
+        "ElevationStart": pl.Float64,
+        "NorthingEnd": pl.Float64,
+        "EastingEnd": pl.Float64,
+        "ElevationEnd": pl.Float64,
+        "LatitudeStart": pl.Float64,
+        "LongitudeStart": pl.Float64,
+        "LatitudeEnd": pl.Float64,
+        "LongitudeEnd": pl.Float64,
+    },
+    "tblLPIHeader": {
+        "LineLengthAmount": pl.Float64,
+        "SpacingIntervalAmount": pl.Float64,
+    },
+    "tblLPIDetail": {
+        "PointLoc": pl.Float64,
+        "PointNbr": pl.Int64,
+    },
+    "tblGapHeader": {
+        "LineLengthAmount": pl.Float64,
+        "GapMin": pl.Float64,
+    },
+    "tblGapDetail": {
+        "SeqNo": pl.Int64,
+        "GapStart": pl.Float64,
+        "GapEnd": pl.Float64,
+        "Gap": pl.Float64,
+    },
+    "tblSoilStabDetail": {
+        "BoxNum": pl.Int64,
+    },
+    "tblSpecRichHeader": {
+        "SpecRichNbrSubPlots": pl.Int64,
+    },
+    "tblPlantDenDetail": {
+        "Quadrat": pl.Int64,
+    },
+}
+
+
+def is_text_column(column: str) -> bool:
+    """Keys, IDs and dates are always read as text so joins and format_dates see the same type."""
+    lowered = column.lower()
+    return lowered.endswith("key") or lowered.endswith("id") or "date" in lowered
+
+def widen_dtype(left: pl.DataType, right: pl.DataType) -> pl.DataType:
+    """Smallest registry type that can hold values of both types."""
+    if left == right:
+        return left
+    if left in (pl.Int64, pl.Float64) and right in (pl.Int64, pl.Float64):
+        return pl.Float64
+    return pl.String
+
+def table_name_from_path(file_path: str) -> str:
+    """`<source>_<table>.csv` -> `<table>`, matching classify_table's split."""
+    base_name = os.path.splitext(os.path.basename(file_path))[0]
+    return base_name.split("_", 1)[-1]
+
+
+class SchemaRegistry:
+    """Per-table column types, backed by a JSON file in learn mode."""
+
+    def __init__(self, path: str = SCHEMA_REGISTRY_PATH, mode: str = SCHEMA_REGISTRY_MODE):
+        self.path = path
+        self.mode = mode
+        self._learned = {}
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as registry_file:
+                stored = json.load(registry_file)
+            self._learned = {
+                table: {col: DTYPES.get(name, pl.String) for col, name in columns.items()}
+                for table, columns in stored.items()
+            }
+            logger.info(f"Loaded schema registry for {len(self._learned)} tables from {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to load schema registry {self.path}: {e}")
+
+    def save(self):
+        stored = {
+            table: {col: str(dtype) for col, dtype in columns.items()}
+            for table, columns in sorted(self._learned.items())
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w") as registry_file:
+            json.dump(stored, registry_file, indent=2, sort_keys=True)
+
+    def known_dtype(self, table: str, column: str):
+        """Type from the learned registry, the built-in definitions or the naming rules; None if unknown."""
+        if column in self._learned.get(table, {}):
+            return self._learned[table][column]
+        if column in BUILTIN_SCHEMAS.get(table, {}):
+            return BUILTIN_SCHEMAS[table][column]
+        if is_text_column(column):
+            return pl.String
+        return None
+
+    def learn(self, table: str, file_path: str, columns: list, widen: bool = False):
+        """
+        Infers the unknown columns of a file once and persists them.
+        With widen=True, learned columns are widened to hold this file's values too.
+        """
+        inferred = pl.read_csv(file_path, null_values=CSV_NULL_VALUES, infer_schema_length=None).schema
+        with self._lock:
+            learned = self._learned.setdefault(table, {})
+            for col in columns:
+                dtype = inferred.get(col, pl.String)
+                dtype = dtype if dtype in (pl.Int64, pl.Float64) else pl.String
+                current = self.known_dtype(table, col)
+                if current is None:
+                    learned[col] = dtype
+                elif widen and widen_dtype(current, dtype) != current:
+                    learned[col] = widen_dtype(current, dtype)
+            self.save()
+        logger.info(f"Learned schema for {table} from {file_path}")
+
+    def resolve(self, file_path: str) -> dict:
+        """Full read schema for a CSV file, in the file's column order."""
+        table = table_name_from_path(file_path)
+        columns = pl.read_csv(file_path, n_rows=0).columns
+
+        unknown = [col for col in columns if self.known_dtype(table, col) is None]
+        if unknown and self.mode == "learn":
+            self.learn(table, file_path, unknown)
+
+        return {col: self.known_dtype(table, col) or pl.String for col in columns}
+
+
+schema_registry = SchemaRegistry()
+
+
+def read_csv_with_schema(file_path: str) -> pl.DataFrame:
+    """
+    Reads a CSV with the registry schema (no inference pass).
+    In learn mode a file whose values do not fit the learned types widens them and is read again.
+    """
+    schema = schema_registry.resolve(file_path)
+    try:
+        return pl.read_csv(file_path, schema=schema, null_values=CSV_NULL_VALUES)
+    except pl.exceptions.ComputeError:
+        if schema_registry.mode != "learn":
+            raise
+        logger.warning(f"{file_path} does not match the registered schema, widening column types")
+        schema_registry.learn(table_name_from_path(file_path), file_path, list(schema), widen=True)
+        return pl.read_csv(file_path, schema=schema_registry.resolve(file_path), null_values=CSV_NULL_VALUES)
+
+def scan_csv_with_schema(file_path: str) -> pl.LazyFrame:
+    """Lazy counterpart of read_csv_with_schema."""
+    return pl.scan_csv(file_path, schema=schema_registry.resolve(file_path), null_values=CSV_NULL_VALUES)
@@ -0,0 +1,134 @@
+import polars as pl
+import logging
+import os, os.path
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from _2_dima_loadingest.config import (
+    OUTPUT_SINKS,
+    PARQUET_SINK_DIR,
+    PARQUET_COMPRESSION,
+    PARQUET_ROW_GROUP_SIZE,
+)
+from _2_dima_loadingest.scripts.db_connector import insert_dataframe_to_db
+from _2_dima_loadingest.scripts.metrics import instrument
+
+logger = logging.getLogger(__name__)
+
+"""
+Output sinks for joined, PrimaryKey-stamped tables.
+
+Every sink has write(df, table_name, source, data_type, key_columns, replace) returning the
+rows written, or None on failure; replace means the source's previous load of the table is
+replaced (a changed file loaded again). The sinks of a run are chosen with OUTPUT_SINKS or
+`ingest --sinks=postgres,parquet`; a table counts as loaded (and is recorded in the
+manifest) only when every sink wrote it.
+"""
+
+
+class PostgresSink:
+    """SCHEMA in the configured database, through insert_dataframe_to_db (COPY or upsert)."""
+    name = "postgres"
+
+    def write(self, df, table_name, source, data_type, key_columns=None, replace=False):
+        return insert_dataframe_to_db(
+            df, table_name, key_columns=key_columns, replace_source=source if replace else None,
+        )
+
+
+class ParquetSink:
+    """
+    Local Parquet dataset, one hive-partitioned dataset per table:
+        <root>/<table_name>/data_type=<data_type>/DBKey=<source>/part-0.parquet
+    DBKey is carried by the path, so it is not repeated in the file. Every write replaces
+    the DIMA's partition. Files are written to a temporary name and moved into place,
+    compressed with `compression` in row groups of `row_group_size` rows; writes from the
+    DB writer threads run in parallel.
+    """
+    name = "parquet"
+
+    def __init__(self, root: str = PARQUET_SINK_DIR, compression: str = PARQUET_COMPRESSION,
+                 row_group_size: int = PARQUET_ROW_GROUP_SIZE):
+        self.root = root
+        self.compression = compression
+        self.row_group_size = row_group_size
+
+    def partition_dir(self, table_name, source, data_type):
+        return os.path.join(self.root, table_name, f"data_type={data_type}", f"DBKey={source}")
+
+    @instrument("write_parquet")
+    def write(self, df, table_name, source, data_type, key_columns=None, replace=False):
+        partition_dir = self.partition_dir(table_name, source, data_type)
+        try:
+            os.makedirs(partition_dir, exist_ok=True)
+            if "DBKey" in df.collect_schema().names():
+                df = df.drop("DBKey")
+
+            fd, partial_path = tempfile.mkstemp(dir=partition_dir, prefix=".part-", suffix=".parquet")
+            os.close(fd)
+            if isinstance(df, pl.LazyFrame):
+                df.sink_parquet(partial_path, compression=self.compression, row_group_size=self.row_group_size)
+                rows = pl.scan_parquet(partial_path).select(pl.len()).collect().item()
+            else:
+                df.write_parquet(partial_path, compression=self.compression, row_group_size=self.row_group_size)
+                rows = df.height
+            os.replace(partial_path, os.path.join(partition_dir, "part-0.parquet"))
+            logger.info(f"Wrote {rows} rows to {partition_dir}")
+            return rows
+        except Exception as e:
+            logger.error(f"Error writing {table_name} for {source} to Parquet: {e}")
+            if "partial_path" in locals() and os.path.exists(partial_path):
+                os.remove(partial_path)
+            return None
+
+
+SINKS = {
+    "postgres": PostgresSink,
+    "parquet": ParquetSink,
+}
+
+active_sinks = []
+
+
+def unknown_sinks(names) -> list:
+    return [name for name in names if name not in SINKS]
+
+def configure_sinks(names=OUTPUT_SINKS) -> list:
+    """
+    Selects the sinks of this run by name; unknown names are logged and ignored
+    (`ingest` rejects them before starting, see unknown_sinks).
+    """
+    selected = []
+    for name in names:
+        if name in SINKS:
+            selected.append(SINKS[name]())
+        else:
+            logger.error(f"Unknown output sink: {name} (available: {', '.join(SINKS)})")
+    active_sinks[:] = selected
+    logger.info(f"Output sinks: {', '.join(sink.name for sink in selected) or 'none'}")
+    return selected
+
+def sink_names() -> list:
+    return [sink.name for sink in active_sinks]
+
+def write_to_sinks(df, table_name, source, data_type, key_columns=None, replace=False):
+    """
+    Writes one table to every active sink, concurrently when there are several.
+    Returns the rows written, or None when any sink failed or none is configured.
+    """
+    if not active_sinks:
+        logger.error(f"Not writing {table_name} for {source}: no output sinks configured")
+        return None
+
+    if len(active_sinks) == 1:
+        results = [active_sinks[0].write(df, table_name, source, data_type, key_columns, replace)]
+    else:
+        with ThreadPoolExecutor(max_workers=len(active_sinks)) as executor:
+            futures = [
+                executor.submit(sink.write, df, table_name, source, data_type, key_columns, replace)
+                for sink in active_sinks
+            ]
+            results = [future.result() for future in futures]
+
+    if any(rows is None for rows in results):
+        return None
+    return results[0]
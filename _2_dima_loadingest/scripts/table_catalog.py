@@ -0,0 +1,93 @@
+import logging
+import threading
+from _2_dima_loadingest.config import SCHEMA
+
+logger = logging.getLogger(__name__)
+
+
+class TableCatalog:
+    """
+    Run-scoped cache of the tables and column types in SCHEMA, read from
+    information_schema once per run so loads into existing tables need no DDL.
+    Only committed DDL is cached: tables created or altered in a transaction are staged
+    per connection and published when db_session commits, or dropped on rollback, so
+    another writer never sees a table its own transaction cannot see yet.
+    """
+
+    def __init__(self, schema: str = SCHEMA):
+        self.schema = schema
+        self.tables = {}
+        self._loaded = False
+        # DDL of open transactions, keyed by id(connection)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Drops the cache; the next lookup reads information_schema again."""
+        with self._lock:
+            self.tables = {}
+            self._loaded = False
+            self._pending = {}
+
+    def _read(self, conn, table_name: str = None) -> dict:
+        query = """
+        SELECT table_name, column_name, data_type
+        FROM information_schema.columns
+        WHERE table_schema = %s
+        """
+        params = [self.schema]
+        if table_name is not None:
+            query += " AND table_name = %s"
+            params.append(table_name)
+        query += " ORDER BY table_name, ordinal_position"
+
+        tables = {}
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            for table, column, data_type in cursor.fetchall():
+                tables.setdefault(table, {})[column] = data_type
+        return tables
+
+    def columns(self, table_name: str, conn, refresh: bool = False) -> dict:
+        """
+        {column: SQL data type} of an existing table, or None when it does not exist.
+        refresh reads the table from information_schema again, e.g. after waiting for
+        another session's DDL to commit.
+        """
+        with self._lock:
+            loaded = self._loaded
+
+        if not loaded:
+            tables = self._read(conn)
+            with self._lock:
+                if not self._loaded:
+                    self.tables, self._loaded = tables, True
+                    logger.info(f"Read catalog of {len(tables)} tables in {self.schema}")
+        elif refresh:
+            tables = self._read(conn, table_name)
+            with self._lock:
+                self.tables.pop(table_name, None)
+                self.tables.update(tables)
+
+        with self._lock:
+            existing = self.tables.get(table_name)
+            return dict(existing) if existing is not None else None
+
+    def stage_columns(self, conn, table_name: str, column_types: dict):
+        """Records columns created or added by DDL in conn's open transaction."""
+        with self._lock:
+            self._pending.setdefault(id(conn), {}).setdefault(table_name, {}).update(column_types)
+
+    def publish(self, conn):
+        """Adds the DDL staged on conn to the cache; called once its transaction committed."""
+        with self._lock:
+            for table_name, column_types in self._pending.pop(id(conn), {}).items():
+                self.tables.setdefault(table_name, {}).update(column_types)
+
+    def discard(self, conn):
+        """Drops the DDL staged on conn; called when its transaction rolled back."""
+        with self._lock:
+            self._pending.pop(id(conn), None)
+
+
+table_catalog = TableCatalog()
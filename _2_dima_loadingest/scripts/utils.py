@@ -1,103 +1,380 @@
 
 from _2_dima_loadingest.scripts.data_cleaner import add_date_loaded_column, deduplicate_dataframe
 from _2_dima_loadingest.scripts.db_connector import insert_dataframe_to_db
-from _2_dima_loadingest.config import fulljoin_key
+from _2_dima_loadingest.scripts.frame_cache import frame_cache
+from _2_dima_loadingest.scripts.metrics import instrument, pipeline_metrics
+from _2_dima_loadingest.scripts.columnar import (
+    read_table_file,
+    scan_table_file,
+    select_ingest_files,
+    table_columns,
+    is_columnar,
+)
+from _2_dima_loadingest.config import fulljoin_key, lineplotjoin_key, DATE_FORMATS, DATE_SAMPLE_SIZE, COMPACT_JOIN_KEYS, COMPACT_FRAMES
 
 import polars as pl
 import logging
 import os, os.path
+import threading
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+# both keyed by (source DBKey, data_type) so every DIMA is an independent unit of work
 temp_storage = {}
 pksources = {}
+# prebuilt integer join indexes on a pksource, keyed by (source, data_type, join_key)
+join_indexes = {}
+# guards temp_storage/pksources when units are ingested on parallel workers
+storage_lock = threading.RLock()
 
 """
 helper functions for data_loader: process_csv
 """
+# non key/date columns the pksource joins still need
+PKSOURCE_JOIN_COLUMNS = {"StackID", "BoxID"}
+
+@instrument(reads_file=True)
+def read_table(file_path):
+    """Reads an extracted table (CSV with the registry schema, or memory-mapped Parquet/IPC)."""
+    return read_table_file(file_path)
+
+def scan_csv_file(file_path):
+    """Lazily scans an extracted table so later stages can run as one streaming query."""
+    return scan_table_file(file_path)
+
 def load_csv_file(file_path):
-    """Loads a CSV file into a Polars DataFrame, handling missing values."""
+    """
+    Loads an extracted CSV (or Parquet/IPC) file into a Polars DataFrame, handling missing values.
+    Reuses the frame when the pksource step already parsed this file during the run.
+    """
     try:
-        return pl.read_csv(file_path, null_values=["NA", "N/A", "null"], infer_schema_length=10000000)
+        cached = frame_cache.peek(file_path)
+        if cached is not None:
+            return cached
+        return read_table(file_path)
     except Exception as e:
         logger.error(f"Failed to load CSV: {file_path} | Error: {e}")
         return None
 
 def add_timestamps_and_source(df, source):
-    """Adds a current timestamp and source column to a DataFrame."""
+    """Adds a current timestamp and source column to a DataFrame or LazyFrame."""
     if df is None:
         return None
 
-    # Add Current Timestamp
-    current_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Add Current Timestamp (built as a Datetime literal, second precision)
+    current_timestamp = datetime.now().replace(microsecond=0)
     df = df.with_columns(
-        pl.lit(current_timestamp).str.strptime(pl.Datetime, "%Y-%m-%d %H:%M:%S").alias("DateLoadedInDB")
+        pl.lit(current_timestamp, dtype=pl.Datetime("us")).alias("DateLoadedInDB")
     )
 
-    # Add Source Column
-    df = df.with_columns(pl.lit(source).alias("DBKey"))
+    # Add Source Column; one repeated value, so Categorical when frames are compacted
+    df = df.with_columns(pl.lit(source, dtype=pl.Categorical if COMPACT_FRAMES else pl.String).alias("DBKey"))
 
     return df
-def store_dataframe(data_type, table_type, df):
-    """Stores a DataFrame into temporary storage."""
-    if data_type not in temp_storage:
-        temp_storage[data_type] = {}
-    temp_storage[data_type][table_type] = df
-
-def perform_ordered_joins(data_type):
-
-    """Handles ordered joins and ensures every table gets a PrimaryKey."""
-    if data_type not in pksources:
-        logger.error(f"PrimaryKey source not found for {data_type}. Skipping joins.")
-        return
+def store_dataframe(source, data_type, table_type, df):
+    """Stores a DataFrame into temporary storage under its (source, data_type) unit."""
+    unit = (source, data_type)
+    with storage_lock:
+        if unit not in temp_storage:
+            temp_storage[unit] = {}
+        temp_storage[unit][table_type] = df
+
+def clear_unit(source, data_type):
+    """Drops the stored tables and pksource of one unit so it can be re-processed on its own."""
+    unit = (source, data_type)
+    with storage_lock:
+        temp_storage.pop(unit, None)
+        pksources.pop(unit, None)
+        drop_join_indexes(source, data_type)
+
+def release_pksource(source, data_type):
+    """Drops a unit's pksource and its join indexes once no table of the run needs them."""
+    with storage_lock:
+        if pksources.pop((source, data_type), None) is not None:
+            logger.info(f"Released primary key source for {source} {data_type}")
+        drop_join_indexes(source, data_type)
+
+def clear_storage():
+    """Drops every held table, pksource and join index; called at the end of an ingest run."""
+    with storage_lock:
+        temp_storage.clear()
+        pksources.clear()
+        join_indexes.clear()
+
+def drop_join_indexes(source, data_type):
+    """Drops the join indexes built on a unit's pksource, e.g. when the pksource is rebuilt."""
+    with storage_lock:
+        for index_key in [k for k in join_indexes if k[:2] == (source, data_type)]:
+            join_indexes.pop(index_key)
+
+def perform_ordered_joins(source, data_type, table_type=None):
+
+    """
+    Handles ordered joins and ensures every table of a (source, data_type) unit gets a PrimaryKey.
+    With table_type only that table is joined, so files of one unit can be processed concurrently.
+    """
+    unit = (source, data_type)
     if data_type == 'NoPrimaryKey':
         logger.error(f"Found '{data_type}' data type. Skipping joins.")
         return
+    if unit not in pksources:
+        logger.error(f"PrimaryKey source not found for {source} {data_type}. Skipping joins.")
+        return
 
 
-    pk_source = pksources[data_type]  # Get the pre-joined primary key source
+    with storage_lock:
+        pk_source = pksources[unit]  # Get the pre-joined primary key source
+        tables = temp_storage[unit]
+
+    table_types = [table_type] if table_type is not None else list(tables)
 
     # Join existing tables with pk_source to propagate PrimaryKey
-    for table_type in temp_storage[data_type]:
-        if "PrimaryKey" not in temp_storage[data_type][table_type].columns:
-            temp_storage[data_type][table_type] = temp_storage[data_type][table_type].join(
-                pk_source, on=fulljoin_key[data_type][table_type], how="left"
-            )
+    for table_type in table_types:
+        if "PrimaryKey" not in tables[table_type].columns:
+            join_key = fulljoin_key[data_type][table_type]
+            with pipeline_metrics.context(source, data_type, table_type), \
+                    pipeline_metrics.stage("perform_ordered_joins") as record:
+                record["rows_in"] = tables[table_type].height
+                if COMPACT_JOIN_KEYS:
+                    tables[table_type] = join_on_codes(tables[table_type], source, data_type, join_key)
+                else:
+                    table = match_join_key(tables[table_type], pk_source, join_key)
+                    tables[table_type] = table.join(pk_source, on=join_key, how="left")
+                record["rows_out"] = tables[table_type].height
 
     # Final PrimaryKey validation
-    validate_primary_keys(data_type)
+    validate_primary_keys(source, data_type, table_types)
+
+def join_primary_key_lazy(lf, source, data_type, table_type):
+    """Adds the PrimaryKey join to a LazyFrame; returns it unchanged when the unit has no pksource."""
+    pk_source = pksources.get((source, data_type))
+    if data_type == "NoPrimaryKey" or pk_source is None:
+        return lf
+    join_key = fulljoin_key[data_type][table_type]
+    if COMPACT_JOIN_KEYS:
+        return join_on_codes(lf, source, data_type, join_key)
+    return match_join_key(lf, pk_source, join_key).join(pk_source.lazy(), on=join_key, how="left")
+
+def match_join_key(df, pk_source, join_key):
+    """Casts the join column to the pksource's dtype (String vs Categorical) so the join can run."""
+    key_dtype = pk_source.collect_schema()[join_key]
+    if df.collect_schema()[join_key] == key_dtype:
+        return df
+    return df.with_columns(pl.col(join_key).cast(pl.String).cast(key_dtype))
+
+# integer column the compact joins run on
+JOIN_CODE = "__join_code"
+
+def get_join_index(source, data_type, join_key):
+    """
+    Returns (enum dtype, index frame) for joining on join_key against the unit's pksource.
+    The pksource keys are dictionary-encoded once into a pl.Enum; the index holds the
+    pksource with the key replaced by its UInt32 code, sorted by code, and is reused by
+    every table of the unit that joins on the same key.
+    """
+    index_key = (source, data_type, join_key)
+    with storage_lock:
+        if index_key in join_indexes:
+            return join_indexes[index_key]
+        pk_source = pksources[(source, data_type)]
+
+    keys = pk_source.get_column(join_key).cast(pl.String).drop_nulls().unique(maintain_order=True)
+    key_enum = pl.Enum(keys)
+    index = (
+        pk_source
+        .with_columns(pl.col(join_key).cast(pl.String).cast(key_enum).to_physical().alias(JOIN_CODE))
+        .drop(join_key)
+        .sort(JOIN_CODE)
+    )
+
+    with storage_lock:
+        join_indexes[index_key] = (key_enum, index)
+    logger.info(f"Built join index on {join_key} for {source} {data_type} ({len(keys)} keys)")
+    return key_enum, index
+
+def join_on_codes(df, source, data_type, join_key):
+    """
+    Left-joins a DataFrame or LazyFrame to the unit's pksource on integer key codes.
+    Gives the same rows and columns as joining on the text key: keys missing from the
+    pksource encode to null and get a null PrimaryKey.
+    """
+    key_enum, index = get_join_index(source, data_type, join_key)
+    if isinstance(df, pl.LazyFrame):
+        index = index.lazy()
+    return (
+        df
+        .with_columns(pl.col(join_key).cast(pl.String).cast(key_enum, strict=False).to_physical().alias(JOIN_CODE))
+        .join(index, on=JOIN_CODE, how="left")
+        .drop(JOIN_CODE)
+    )
 
+def upsert_key_columns(data_type, table_type):
+    """Columns identifying a table's rows for upserts: DBKey plus the table's fulljoin_key column."""
+    join_column = fulljoin_key.get(data_type, {}).get(table_type)
+    return ["DBKey", join_column] if join_column else ["DBKey"]
+
+def target_table_name(data_type, table_type):
+    """Database table name for a classified file, e.g. (tblLPI, Detail) -> tblLPIDetail."""
+    if data_type in ("Base", "NoPrimaryKey"):
+        return table_type if table_type.startswith("tbl") else f"tbl{table_type}"
+    return f"{data_type}{table_type}"
+
+def index_key_columns(data_type, table_type):
+    """
+    Column sets indexed after a bulk load: PrimaryKey, the upsert keys (DBKey + fulljoin_key
+    column) and the table's fulljoin_key/lineplotjoin_key join columns.
+    """
+    index_sets = [["PrimaryKey"]] if data_type != "NoPrimaryKey" else []
+    index_sets.append(upsert_key_columns(data_type, table_type))
+    for join_column in (fulljoin_key.get(data_type, {}).get(table_type), lineplotjoin_key.get(data_type)):
+        if join_column:
+            index_sets.append([join_column])
+    return [list(columns) for columns in dict.fromkeys(tuple(columns) for columns in index_sets)]
+
+def table_index_plan(file_names):
+    """{table name: column sets to index} for the tables a run loads."""
+    plan = {}
+    for file_name in file_names:
+        source, data_type, table_type = classify_table(file_name)
+        if not source or not data_type or not table_type:
+            continue
+        index_sets = plan.setdefault(target_table_name(data_type, table_type), [])
+        index_sets.extend(columns for columns in index_key_columns(data_type, table_type) if columns not in index_sets)
+    return plan
 
 
 """
 helper functions for create pksource
 """
+@instrument()
 def create_primary_key(df: pl.DataFrame, key_fields: list) -> pl.DataFrame:
-    # Concatenate the fields to create a PrimaryKey
-    return df.with_columns((pl.concat_str(key_fields, separator="")).alias("PrimaryKey"))
-
-def load_dataframe(file_list, keyword, data_dir):
-    """Find and load a CSV file based on a keyword match."""
+    # Concatenate the fields to create a PrimaryKey; dates are only turned into text here
+    schema = df.collect_schema()
+    fields = [
+        pl.col(field).dt.strftime("%Y-%m-%d") if schema[field] in (pl.Date, pl.Datetime) else pl.col(field)
+        for field in key_fields
+    ]
+    return df.with_columns((pl.concat_str(fields, separator="")).alias("PrimaryKey"))
+
+def find_file(file_list, keyword, data_dir):
+    """Find an extracted file path based on a keyword match."""
     file_name = next((f for f in file_list if keyword.lower() in f.lower()), None)
     if file_name:
-        file_path = os.path.normpath(os.path.join(data_dir, file_name))
-        return pl.read_csv(file_path, null_values=["NA", "N/A", "null"], infer_schema_length=10000000)
+        return os.path.normpath(os.path.join(data_dir, file_name))
     return None
 
+def load_pksource_frame(file_path):
+    """
+    Loads a file for pksource building, at most once per run.
+    Columnar files are read with only the key/date/join columns the pksource keeps;
+    CSVs are parsed whole so process_csv can reuse the cached frame.
+    """
+    if not is_columnar(file_path):
+        return frame_cache.get_or_load(file_path, read_table)
+
+    def read_key_columns():
+        columns = [
+            col for col in table_columns(file_path)
+            if "key" in col.lower() or "date" in col.lower() or col in PKSOURCE_JOIN_COLUMNS
+        ]
+        return read_table_file(file_path, columns)
+
+    return frame_cache.get_or_compute("keys", [file_path], read_key_columns)
+
+def load_dataframe(file_list, keyword, data_dir):
+    """Find and load an extracted file based on a keyword match, parsing it at most once per run."""
+    file_path = find_file(file_list, keyword, data_dir)
+    if file_path:
+        return load_pksource_frame(file_path)
+    return None
+
+def list_source_files(data_dir, source=None):
+    """Extracted files of one source DIMA (all sources when None), one file per table."""
+    files = select_ingest_files(os.listdir(data_dir), data_dir)
+    if source is not None:
+        files = [f for f in files if f.startswith(f"{source}_")]
+    return files
+
+def load_lines_plots(data_dir, source=None, files=None):
+    """
+    Returns the Lines-Plots join for a source DIMA, joined once per run and cached.
+    files is the source's already listed file names; the directory is listed when omitted.
+    """
+    if files is None:
+        files = list_source_files(data_dir, source)
+    lines_path = find_file(files, "lines", data_dir)
+    plots_path = find_file(files, "plots", data_dir)
+    if lines_path is None or plots_path is None:
+        return None
+
+    return frame_cache.get_or_compute(
+        "lines_plots",
+        [lines_path, plots_path],
+        lambda: join_dataframes(
+            load_pksource_frame(lines_path),
+            load_pksource_frame(plots_path),
+            "PlotKey",
+        ),
+    )
+
+def parse_date(col, date_format):
+    """Parses a text column with one format; implausible years (e.g. %Y reading "21") become null."""
+    parsed = pl.col(col).str.strptime(pl.Date, date_format, strict=False)
+    return pl.when(parsed.dt.year() >= 1900).then(parsed)
+
+def detect_date_formats(sample: pl.DataFrame, col: str) -> list:
+    """DATE_FORMATS that parse values of the sample column, best match first."""
+    counts = sample.select([
+        parse_date(col, date_format).count().alias(str(i)) for i, date_format in enumerate(DATE_FORMATS)
+    ]).row(0)
+    matched = [(count, -i) for i, count in enumerate(counts) if count > 0]
+    return [DATE_FORMATS[-i] for count, i in sorted(matched, reverse=True)]
+
+@instrument()
 def format_dates(df):
-    """Convert all date columns to YYYY-MM-DD format."""
+    """
+    Normalizes every date column of a DataFrame or LazyFrame to a native pl.Date.
+    The format of each text column is detected from a sample, then the column is
+    parsed in one vectorized pass, falling back through the other matching formats.
+    Columns where no format matches are left as they are.
+    """
     if df is not None:
-        date_columns = [col for col in df.columns if "date" in col.lower()]
-        df = df.with_columns([
-            df[col].str.strptime(pl.Date, "%m/%d/%y %H:%M:%S").dt.strftime("%Y-%m-%d").alias(col)
-            for col in date_columns
-        ])
+        schema = df.collect_schema()
+        date_columns = [col for col in schema.names() if "date" in col.lower()]
+        text_columns = [col for col in date_columns if schema[col] == pl.String]
+
+        sample = df.select(text_columns).head(DATE_SAMPLE_SIZE)
+        if isinstance(sample, pl.LazyFrame):
+            sample = sample.collect()
+
+        expressions = []
+        for col in date_columns:
+            if schema[col] == pl.Date:
+                continue
+            if schema[col] == pl.Datetime:
+                expressions.append(pl.col(col).dt.date().alias(col))
+                continue
+            if col not in text_columns:
+                continue
+            date_formats = detect_date_formats(sample.drop_nulls(col), col)
+            if not date_formats:
+                logger.warning(f"No known date format matches column {col}, leaving it unchanged")
+                continue
+            expressions.append(pl.coalesce([parse_date(col, f) for f in date_formats]).alias(col))
+
+        if expressions:
+            df = df.with_columns(expressions)
     return df
 
-def find_and_load_files(data_type, data_dir):
-    """Finds and loads all relevant files for the given data_type, with special handling for 'Base'."""
-    files = [f for f in os.listdir(data_dir) if data_type in f or "lines" in f.lower() or "plots" in f.lower()]
+def find_and_load_files(data_type, data_dir, source=None, files=None):
+    """
+    Finds and loads all relevant files for the given data_type, with special handling for 'Base'.
+    When source is given only that DIMA's files (`<source>_<table>.csv`) are considered.
+    files is the source's already listed file names; the directory is listed when omitted.
+    """
+    if files is None:
+        files = list_source_files(data_dir, source)
 
     # Special handling for "Base" (Uses `tblGap` for Header and Detail)
     if data_type == "Base":
@@ -108,6 +385,8 @@ def find_and_load_files(data_type, data_dir):
             "lines": load_dataframe(base_files, "lines", data_dir),
             "plots": load_dataframe(base_files, "plots", data_dir),
         }
+    files = [f for f in files if data_type in f or "lines" in f.lower() or "plots" in f.lower()]
+
     # filtering soilstab from soilpits
     if data_type == 'tblSoil':
         files = [i for i in files if 'stab' not in i.lower()]
@@ -125,6 +404,7 @@ def find_and_load_files(data_type, data_dir):
         "pithorizons": load_dataframe(files, "pithorizons", data_dir),
     }
 
+@instrument()
 def join_dataframes(base_df, join_df, join_key, suffix="_right1"):
     """Joins two DataFrames on a given key while removing duplicated suffixes."""
     if join_df is not None:
@@ -132,16 +412,21 @@ def join_dataframes(base_df, join_df, join_key, suffix="_right1"):
         base_df = base_df.select([col for col in base_df.columns if suffix not in col])
     return base_df
 
-def validate_primary_keys(data_type):
-    """Ensures all tables under the data type have a PrimaryKey column."""
-    for table_type, df in temp_storage[data_type].items():
+def validate_primary_keys(source, data_type, table_types=None):
+    """Ensures all tables (or the given table_types) under the (source, data_type) unit have a PrimaryKey column."""
+    with storage_lock:
+        tables = [
+            (table_type, df) for table_type, df in temp_storage[(source, data_type)].items()
+            if table_types is None or table_type in table_types
+        ]
+    for table_type, df in tables:
         if "PrimaryKey" not in df.columns:
-            logger.warning(f"Table {data_type}_{table_type} is missing PrimaryKey!")
+            logger.warning(f"Table {source}_{data_type}{table_type} is missing PrimaryKey!")
 
 
 def classify_table(file_name: str):
     """Classifies a table by extracting table type and data type from filename."""
-    base_name = os.path.splitext(file_name)[0]  # Remove .csv
+    base_name = os.path.splitext(file_name)[0]  # Remove .csv/.parquet/.arrow
     parts = base_name.split("_", 1)
 
     if len(parts) < 2:
@@ -1 +1,112 @@
-# schemaplan 
\ No newline at end of file
+import polars as pl
+import logging
+import threading
+from _2_dima_loadingest.config import fulljoin_key, VALIDATION_THRESHOLDS, VALIDATION_THRESHOLDS_BY_DATA_TYPE
+
+logger = logging.getLogger(__name__)
+
+"""
+Referential-integrity checks run on joined tables before they are written.
+
+For every table of a (source, data_type) unit, against the unit's pksource:
+- null_key:       rows whose left join left PrimaryKey null
+- orphans:        rows whose join key has no match in the pksource (detail rows
+                  without a header, headers without a line/plot)
+- duplicate_keys: join-key values found more than once in the pksource
+- duplicate_rows: table rows matching such a key, i.e. rows the join multiplies
+All counts are anti/semi-joins and null counts; the queries of every table in a unit
+are collected together in one pass.
+"""
+
+CHECKS = ("null_key", "orphans", "duplicate_keys", "duplicate_rows")
+
+# results of the run, keyed by (source, table name)
+validation_report = {}
+report_lock = threading.Lock()
+
+
+def validation_thresholds(data_type) -> dict:
+    """VALIDATION_THRESHOLDS with the data type's overrides applied."""
+    return {**VALIDATION_THRESHOLDS, **VALIDATION_THRESHOLDS_BY_DATA_TYPE.get(data_type, {})}
+
+def table_checks(lf: pl.LazyFrame, pk_source: pl.LazyFrame, join_key: str) -> pl.LazyFrame:
+    """One-row LazyFrame with the row count and every check for one joined table."""
+    key_dtype = pk_source.collect_schema()[join_key]
+    if lf.collect_schema()[join_key] != key_dtype:
+        lf = lf.with_columns(pl.col(join_key).cast(pl.String).cast(key_dtype))
+    pk_keys = pk_source.select(join_key).drop_nulls()
+    duplicated = pk_keys.group_by(join_key).len().filter(pl.col("len") > 1).select(join_key)
+
+    null_key = lf.select(
+        pl.len().alias("rows"),
+        pl.col("PrimaryKey").null_count().alias("null_key") if "PrimaryKey" in lf.collect_schema()
+        else pl.len().alias("null_key"),
+    )
+    orphans = lf.join(pk_keys.unique(), on=join_key, how="anti").select(pl.len().alias("orphans"))
+    duplicate_keys = duplicated.join(lf.select(join_key).unique(), on=join_key, how="semi").select(pl.len().alias("duplicate_keys"))
+    duplicate_rows = lf.join(duplicated, on=join_key, how="semi").select(pl.len().alias("duplicate_rows"))
+    return pl.concat([null_key, orphans, duplicate_keys, duplicate_rows], how="horizontal")
+
+def validate_unit(source, data_type, tables: dict, pk_source: pl.DataFrame, table_names: dict = None) -> dict:
+    """
+    Checks the joined tables ({table_type: DataFrame}) of one unit in a single collect.
+    Returns {table_type: counts}; each count set also carries "failed" with the
+    checks whose share of rows exceeds the data type's thresholds (validation_thresholds).
+    """
+    if data_type == "NoPrimaryKey" or pk_source is None or not tables:
+        return {}
+
+    pk_lazy = pk_source.lazy()
+    table_types = [t for t in tables if fulljoin_key.get(data_type, {}).get(t) in tables[t].columns]
+    queries = [table_checks(tables[t].lazy(), pk_lazy, fulljoin_key[data_type][t]) for t in table_types]
+    results = {}
+    for table_type, counts in zip(table_types, pl.collect_all(queries)):
+        table_name = (table_names or {}).get(table_type, f"{data_type}{table_type}")
+        results[table_type] = record_counts(source, data_type, table_name, counts.row(0, named=True))
+    return results
+
+def validate_lazy_table(source, data_type, table_type, lf: pl.LazyFrame, pk_source: pl.DataFrame, table_name: str) -> dict:
+    """
+    Checks one joined LazyFrame of the lazy path with the same queries, run on the
+    streaming engine, so the table is scanned once more but never held in memory.
+    Returns the counts with "failed", or {} when the table has nothing to check.
+    """
+    join_key = fulljoin_key.get(data_type, {}).get(table_type)
+    if data_type == "NoPrimaryKey" or pk_source is None or join_key not in lf.collect_schema().names():
+        return {}
+    counts = table_checks(lf, pk_source.lazy(), join_key).collect(engine="streaming")
+    return record_counts(source, data_type, table_name, counts.row(0, named=True))
+
+def record_counts(source, data_type, table_name, counts: dict) -> dict:
+    """Adds "failed" to one table's counts, stores them in the run's report and logs issues."""
+    counts["failed"] = [
+        check for check, threshold in validation_thresholds(data_type).items()
+        if threshold is not None and counts["rows"] and counts[check] / counts["rows"] > threshold
+    ]
+    with report_lock:
+        validation_report[(source, table_name)] = counts
+    if counts["failed"]:
+        logger.error(f"Validation failed for {source} {table_name} ({', '.join(counts['failed'])}): {format_counts(counts)}")
+    elif any(counts[check] for check in CHECKS):
+        logger.info(f"Validation issues in {source} {table_name}: {format_counts(counts)}")
+    return counts
+
+def format_counts(counts: dict) -> str:
+    return f"{counts['rows']} rows, " + ", ".join(f"{check} {counts[check]}" for check in CHECKS)
+
+def reset_validation_report():
+    with report_lock:
+        validation_report.clear()
+
+def log_validation_report():
+    """Logs every (source, table) with issues at the end of a run."""
+    with report_lock:
+        report = dict(validation_report)
+    if not report:
+        return
+    flagged = {key: counts for key, counts in report.items() if any(counts[check] for check in CHECKS)}
+    failed = sum(1 for counts in report.values() if counts["failed"])
+    logger.info(f"Validated {len(report)} tables: {len(flagged)} with issues, {failed} not loaded")
+    for (source, table_name), counts in sorted(flagged.items()):
+        status = "FAILED" if counts["failed"] else "loaded"
+        logger.info(f"  {source} {table_name} [{status}]: {format_counts(counts)}")
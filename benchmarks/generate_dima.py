@@ -0,0 +1,161 @@
+import argparse
+import os, os.path
+import random
+import sys
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+"""
+Synthetic extracted DIMA tables for benchmarking.
+
+Writes `<source>_<table>.csv` files shaped like the output of extract.sh:
+tblPlots/tblLines, every table family in config.fulljoin_key that has a
+Lines-Plots join key (lineplotjoin_key), and a few NoPrimaryKey tables.
+Each family header carries its fulljoin_key and lineplotjoin_key columns, so
+create_pksource_per_datatype and perform_ordered_joins run on every table.
+"""
+
+# value columns per table type (name -> kind); keys and dates are added from the join config
+VALUE_COLUMNS = {
+    "Header": {"Observer": "name", "Recorder": "name", "Notes": "text"},
+    "Detail": {"SeqNo": "int", "SpeciesCode": "species", "Measurement": "float", "Notes": "text"},
+    "Quads": {"Quadrat": "int", "QuadArea": "float"},
+    "Species": {"SpeciesCode": "species", "Count": "int"},
+    "Pits": {"Observer": "name", "PitDesc": "text"},
+    "PitHorizons": {"HorizonDepthUpper": "float", "HorizonDepthLower": "float", "Texture": "text"},
+}
+
+SPECIES = ["ARTR2", "BOGR2", "PLJA", "ACHY", "BRTE", "GUSA2", "ERNA10", "SPCR"]
+NAMES = ["Bob", "Alice", "Jordan", "Sam", "Riley"]
+# DIMA exports dates as e.g. "03/14/21 00:00:00"
+DATE_FORMAT = "%m/%d/%y %H:%M:%S"
+
+
+def header_key_columns(family, table_type, fulljoin_key, lineplotjoin_key):
+    """Join columns a table needs: its fulljoin key plus, for the family's primary tables, the Lines-Plots key."""
+    columns = [fulljoin_key[family][table_type]]
+    if table_type in ("Header", "Pits"):
+        columns.append(lineplotjoin_key[family])
+    return list(dict.fromkeys(columns))
+
+def value(kind, rng, index):
+    if kind == "int":
+        return str(index)
+    if kind == "float":
+        return f"{rng.uniform(0, 100):.2f}"
+    if kind == "species":
+        return f'"{rng.choice(SPECIES)}"'
+    if kind == "name":
+        return f'"{rng.choice(NAMES)}"'
+    return f'"note {rng.randint(0, 999)}"'
+
+def write_table(output_dir, source, table, columns, rows):
+    path = os.path.join(output_dir, f"{source}_{table}.csv")
+    with open(path, "w") as f:
+        f.write(",".join(columns) + "\n")
+        for row in rows:
+            f.write(",".join(row) + "\n")
+    return path
+
+def generate_dima(output_dir, source, plots=50, lines_per_plot=3, records_per_line=50, seed=0):
+    """
+    Writes one synthetic DIMA. Each plot has lines_per_plot lines, each line one header
+    record per family and records_per_line detail rows. Returns the written paths.
+    """
+    from _2_dima_loadingest.config import fulljoin_key, lineplotjoin_key, pkdate_source
+
+    rng = random.Random(f"{seed}-{source}")
+    start_date = datetime(2021, 1, 1)
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+
+    plot_keys = [f"{source}-P{i:05d}" for i in range(plots)]
+    lines = [(f"{plot_key}-L{j}", plot_key) for plot_key in plot_keys for j in range(lines_per_plot)]
+    modified = (start_date - timedelta(days=30)).strftime(DATE_FORMAT)
+
+    paths.append(write_table(
+        output_dir, source, "tblPlots",
+        ["PlotKey", "PlotID", "DateModified", "Elevation", "Latitude", "Longitude"],
+        ([f'"{p}"', f'"{p[-6:]}"', f'"{modified}"', f"{rng.uniform(1000, 2500):.1f}",
+          f"{rng.uniform(31, 45):.6f}", f"{rng.uniform(-120, -103):.6f}"] for p in plot_keys),
+    ))
+    paths.append(write_table(
+        output_dir, source, "tblLines",
+        ["LineKey", "PlotKey", "LineID", "DateModified", "Azimuth"],
+        ([f'"{line}"', f'"{plot}"', f'"{line[-1]}"', f'"{modified}"', f"{rng.uniform(0, 360):.1f}"]
+         for line, plot in lines),
+    ))
+
+    for family, tables in fulljoin_key.items():
+        if family == "Base" or family not in lineplotjoin_key:
+            continue  # Base is tblLines/tblPlots; families without a Lines-Plots key have no pksource
+        date_column = pkdate_source.get(family, "FormDate")
+        primary = [t for t in tables if t in ("Header", "Pits")]
+        children = [t for t in tables if t not in primary]
+        # the header record key that children join on (RecKey, SoilKey, ...)
+        record_key = tables[children[0]] if children else "RecKey"
+
+        records = []
+        for index, (line, plot) in enumerate(lines):
+            record_date = (start_date + timedelta(days=rng.randint(0, 364))).strftime(DATE_FORMAT)
+            records.append({"LineKey": line, "PlotKey": plot, record_key: f"{line}-{family}-R{index}", "date": record_date})
+
+        for table_type in primary:
+            key_columns = header_key_columns(family, table_type, fulljoin_key, lineplotjoin_key)
+            key_columns = list(dict.fromkeys(key_columns + [record_key]))
+            value_columns = VALUE_COLUMNS[table_type]
+            paths.append(write_table(
+                output_dir, source, f"{family}{table_type}",
+                key_columns + [date_column] + list(value_columns),
+                ([f'"{record[col]}"' for col in key_columns] + [f'"{record["date"]}"']
+                 + [value(kind, rng, i) for kind in value_columns.values()]
+                 for i, record in enumerate(records)),
+            ))
+
+        for table_type in children:
+            join_column = tables[table_type]
+            value_columns = VALUE_COLUMNS.get(table_type, VALUE_COLUMNS["Detail"])
+            paths.append(write_table(
+                output_dir, source, f"{family}{table_type}",
+                [join_column] + list(value_columns),
+                ([f'"{record[join_column]}"'] + [value(kind, rng, n) for kind in value_columns.values()]
+                 for record in records for n in range(records_per_line)),
+            ))
+
+    # NoPrimaryKey tables
+    paths.append(write_table(
+        output_dir, source, "tblSpecies",
+        ["SpeciesCode", "ScientificName", "Duration"],
+        ([f'"{code}"', f'"Species {code}"', '"Perennial"'] for code in SPECIES),
+    ))
+    paths.append(write_table(
+        output_dir, source, "tblPlotNotes",
+        ["PlotKey", "Note", "DateModified"],
+        ([f'"{p}"', value("text", rng, 0), f'"{modified}"'] for p in plot_keys),
+    ))
+    return paths
+
+def generate_dimas(output_dir, dimas=2, plots=50, lines_per_plot=3, records_per_line=50, seed=0):
+    """Writes `dimas` synthetic DIMAs (sources DIMA-001, DIMA-002, ...) into output_dir."""
+    paths = []
+    for i in range(1, dimas + 1):
+        paths.extend(generate_dima(output_dir, f"DIMA-{i:03d}", plots, lines_per_plot, records_per_line, seed))
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic extracted DIMA CSVs")
+    parser.add_argument("output_dir")
+    parser.add_argument("--dimas", type=int, default=2)
+    parser.add_argument("--plots", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=3, help="lines per plot")
+    parser.add_argument("--records", type=int, default=50, help="detail rows per header record")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # importing config sets up file logging relative to the working directory
+    os.makedirs("./_2_dima_loadingest/logs", exist_ok=True)
+
+    written = generate_dimas(args.output_dir, args.dimas, args.plots, args.lines, args.records, args.seed)
+    print(f"Wrote {len(written)} files to {args.output_dir}")
@@ -0,0 +1,306 @@
+import argparse
+import io
+import json
+import os, os.path
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.generate_dima import generate_dimas
+
+"""
+Stage benchmarks for the ingest pipeline.
+
+Generates synthetic DIMAs in a scratch working directory (config paths are relative,
+so the extracted files, schema registry, manifest and logs all live there) and times
+each stage per (source, data_type, table_type), in the order process_csv runs them:
+    load_csv_file, format_dates, compact_dataframe (with COMPACT_FRAMES), create_pksource_per_datatype
+    (with its own format_dates call recorded as "format_dates (pksource)"), perform_ordered_joins,
+    insert_dataframe_to_db
+Results are written as JSON. The DB write goes to the in-process stand-in below by
+default, or with --db postgres to the database configured in .env, into a schema of
+its own (--schema, default BENCHMARK_SCHEMA); the configured production schema is refused.
+
+    python benchmarks/run_benchmarks.py --dimas 4 --plots 200 --records 100 --output bench.json
+"""
+
+# schema --db postgres writes the synthetic DIMAs to
+BENCHMARK_SCHEMA = "dima_benchmark"
+
+
+class StandInCursor:
+    """Accepts the SQL and COPY streams db_connector sends and counts what it received."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.stats["statements"] += 1
+
+    def executemany(self, query, params_list):
+        self.stats["statements"] += len(params_list)
+
+    def copy_expert(self, query, buffer: io.IOBase):
+        data = buffer.read()
+        self.stats["copy_bytes"] += len(data)
+        self.stats["copy_rows"] += data.count(b"\n")
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        return None
+
+    def close(self):
+        pass
+
+class StandInConnection:
+    def __init__(self, stats):
+        self.stats = stats
+
+    def cursor(self):
+        return StandInCursor(self.stats)
+
+    def commit(self):
+        self.stats["commits"] += 1
+
+    def rollback(self):
+        self.stats["rollbacks"] += 1
+
+    def close(self):
+        pass
+
+class StandInPool:
+    """In-process replacement for the psycopg2 pool; nothing leaves the process."""
+
+    def __init__(self):
+        self.closed = False
+        self.stats = defaultdict(int)
+
+    def getconn(self):
+        return StandInConnection(self.stats)
+
+    def putconn(self, conn):
+        pass
+
+    def closeall(self):
+        self.closed = True
+
+
+def prepare_workdir(workdir):
+    """Creates the directories config expects and makes workdir the working directory."""
+    os.makedirs(os.path.join(workdir, "_1_dima_extract", "extracted"), exist_ok=True)
+    os.makedirs(os.path.join(workdir, "_2_dima_loadingest", "logs"), exist_ok=True)
+    os.chdir(workdir)
+
+def timed(records, stage, unit, table_type, func, *args, **kwargs):
+    """Calls func, appends one timing record and returns func's result."""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    records.append({
+        "stage": stage,
+        "source": unit[0],
+        "data_type": unit[1],
+        "table_type": table_type,
+        "seconds": time.perf_counter() - start,
+    })
+    return result
+
+def nested_records(records, stage, unit, since, label):
+    """Appends the pipeline_metrics records of an instrumented stage taken since index since."""
+    from _2_dima_loadingest.scripts.metrics import pipeline_metrics
+
+    for record in pipeline_metrics.records[since:]:
+        if record["stage"] == stage:
+            records.append({
+                "stage": label,
+                "source": unit[0],
+                "data_type": unit[1],
+                "table_type": None,
+                "seconds": record["seconds"],
+                "rows": record.get("rows_out"),
+            })
+
+def run_pipeline(data_dir, records):
+    """Runs every unit through the eager pipeline stage by stage, recording each stage."""
+    from _2_dima_loadingest.config import COMPACT_FRAMES
+    from _2_dima_loadingest.scripts.columnar import select_ingest_files
+    from _2_dima_loadingest.scripts.data_cleaner import compact_dataframe
+    from _2_dima_loadingest.scripts.data_loader import create_pksource_per_datatype
+    from _2_dima_loadingest.scripts.db_connector import insert_dataframe_to_db
+    from _2_dima_loadingest.scripts.frame_cache import frame_cache
+    from _2_dima_loadingest.scripts.metrics import pipeline_metrics
+    from _2_dima_loadingest.scripts.utils import (
+        load_csv_file, add_timestamps_and_source, store_dataframe, format_dates,
+        perform_ordered_joins, clear_unit, classify_table, target_table_name,
+        upsert_key_columns, temp_storage, pksources,
+    )
+
+    frame_cache.clear()
+    # format_dates inside create_pksource_per_datatype is read back from the stage metrics
+    pipeline_metrics.enabled = True
+    pipeline_metrics.reset()
+    units = defaultdict(list)
+    for file_name in select_ingest_files(os.listdir(data_dir), data_dir):
+        units[classify_table(file_name)[:2]].append(file_name)
+    for unit, unit_files in sorted(units.items(), key=str):
+        source, data_type = unit
+        if source is None:
+            continue
+
+        for file_name in unit_files:
+            table_type = classify_table(file_name)[2]
+            file_path = os.path.normpath(os.path.join(data_dir, file_name))
+            cached = frame_cache.peek(file_path) is not None
+            df = timed(records, "load_csv_file", unit, table_type, load_csv_file, file_path)
+            records[-1].update(rows=df.height, cached=cached)
+
+            if any("date" in col.lower() for col in df.columns):
+                df = timed(records, "format_dates", unit, table_type, format_dates, df)
+                records[-1]["rows"] = df.height
+
+            if COMPACT_FRAMES:
+                size_before = df.estimated_size()
+                df = timed(records, "compact_dataframe", unit, table_type, compact_dataframe, df, file_name)
+                records[-1].update(rows=df.height, bytes_before=size_before, bytes_after=df.estimated_size())
+
+            store_dataframe(source, data_type, table_type, add_timestamps_and_source(df, source))
+
+        if data_type != "NoPrimaryKey":
+            since = len(pipeline_metrics.records)
+            timed(records, "create_pksource_per_datatype", unit, None, create_pksource_per_datatype, data_type, source)
+            records[-1]["rows"] = pksources[unit].height if unit in pksources else 0
+            nested_records(records, "format_dates", unit, since, "format_dates (pksource)")
+
+            if unit in pksources:
+                for table_type in list(temp_storage[unit]):
+                    timed(records, "perform_ordered_joins", unit, table_type, perform_ordered_joins, source, data_type, table_type)
+                    records[-1]["rows"] = temp_storage[unit][table_type].height
+
+        for table_type, df in list(temp_storage[unit].items()):
+            rows = timed(
+                records, "insert_dataframe_to_db", unit, table_type, insert_dataframe_to_db,
+                df, target_table_name(data_type, table_type), key_columns=upsert_key_columns(data_type, table_type),
+            )
+            records[-1]["rows"] = rows
+
+        clear_unit(source, data_type)
+
+def summarize(records):
+    """Per-stage totals: calls, seconds, rows and rows/s."""
+    stages = defaultdict(list)
+    for record in records:
+        stages[record["stage"]].append(record)
+
+    summary = {}
+    for stage, stage_records in stages.items():
+        seconds = [r["seconds"] for r in stage_records]
+        rows = sum(r.get("rows") or 0 for r in stage_records)
+        summary[stage] = {
+            "calls": len(stage_records),
+            "seconds": sum(seconds),
+            "median_seconds": statistics.median(seconds),
+            "max_seconds": max(seconds),
+            "rows": rows,
+            "rows_per_second": rows / sum(seconds) if sum(seconds) else None,
+        }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Time each ingest stage on synthetic DIMAs")
+    parser.add_argument("--dimas", type=int, default=2)
+    parser.add_argument("--plots", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=3, help="lines per plot")
+    parser.add_argument("--records", type=int, default=50, help="detail rows per header record")
+    parser.add_argument("--repeat", type=int, default=1, help="pipeline runs over the same data")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", choices=["standin", "postgres"], default="standin")
+    parser.add_argument("--schema", default=BENCHMARK_SCHEMA, help="schema --db postgres writes to")
+    parser.add_argument("--workdir", help="scratch directory (default: a temporary directory, removed afterwards)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+
+    output_path = os.path.abspath(args.output)
+    if args.db == "postgres":
+        # config reads DIMA_SCHEMA on import, so every module writes to the benchmark schema
+        os.environ["DIMA_SCHEMA"] = args.schema
+    workdir = args.workdir or tempfile.mkdtemp(prefix="dima-bench-")
+    cwd = os.getcwd()
+    prepare_workdir(workdir)
+    try:
+        import polars as pl
+        from _2_dima_loadingest.config import DATA_DIR, SCHEMA, DEFAULT_SCHEMA
+        if args.db == "postgres" and SCHEMA == DEFAULT_SCHEMA:
+            parser.error(f"refusing to write synthetic DIMAs into the production schema {DEFAULT_SCHEMA}")
+        from _2_dima_loadingest.scripts import db_connector
+
+        generate_start = time.perf_counter()
+        paths = generate_dimas(DATA_DIR, args.dimas, args.plots, args.lines, args.records, args.seed)
+        generate_seconds = time.perf_counter() - generate_start
+
+        stand_in = None
+        if args.db == "standin":
+            stand_in = StandInPool()
+            db_connector._pool = stand_in
+        else:
+            with db_connector.db_session() as conn, conn.cursor() as cursor:
+                cursor.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+
+        runs = []
+        for run in range(args.repeat):
+            records = []
+            run_start = time.perf_counter()
+            run_pipeline(DATA_DIR, records)
+            runs.append({
+                "run": run + 1,
+                "seconds": time.perf_counter() - run_start,
+                "stages": summarize(records),
+                "records": records,
+            })
+
+        result = {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "parameters": vars(args),
+            "environment": {
+                "python": platform.python_version(),
+                "polars": pl.__version__,
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+            },
+            "dataset": {
+                "files": len(paths),
+                "bytes": sum(os.path.getsize(p) for p in paths),
+                "generate_seconds": generate_seconds,
+            },
+            "db": dict(stand_in.stats) if stand_in else {"backend": "postgres", "schema": args.schema},
+            "runs": runs,
+        }
+        with open(output_path, "w") as f:
+            json.dump(result, f, indent=2)
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    for stage, stats in runs[-1]["stages"].items():
+        print(f"{stage:30s} {stats['calls']:5d} calls {stats['seconds']:9.3f}s {stats['rows']:10d} rows")
+    print(f"Wrote {output_path}")
+
+
+if __name__ == "__main__":
+    main()
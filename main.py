@@ -1,10 +1,39 @@
 import cmd
 import docker
+import hashlib
 import os
 import logging
 
-from _2_dima_loadingest.scripts.utils import process_csv
-from _2_dima_loadingest.config import DOCKERFILE_DIR, DATA_DIR
+from _1_dima_extract.local_extract import extract_all
+from _2_dima_loadingest.scripts.data_loader import report_held_tables, clear_run_state
+from _2_dima_loadingest.scripts.planner import build_plan, format_plan, run_plan, affected_files
+from _2_dima_loadingest.scripts.utils import table_index_plan
+from _2_dima_loadingest.scripts.validator import reset_validation_report, log_validation_report
+from _2_dima_loadingest.scripts.db_connector import close_pool, prepare_bulk_load, finish_bulk_load
+from _2_dima_loadingest.scripts.db_writer import db_writer
+from _2_dima_loadingest.scripts.sinks import SINKS, configure_sinks, sink_names, unknown_sinks
+from _2_dima_loadingest.scripts.table_catalog import table_catalog
+from _2_dima_loadingest.scripts.frame_cache import frame_cache
+from _2_dima_loadingest.scripts.manifest import ingest_manifest
+from _2_dima_loadingest.scripts.metrics import pipeline_metrics
+from _2_dima_loadingest.scripts.columnar import select_ingest_files, convert_csv_files
+from _2_dima_loadingest.config import (
+    DOCKERFILE_DIR,
+    DIMA_DIR,
+    DATA_DIR,
+    EXTRACT_BACKEND,
+    EXTRACT_FORMAT,
+    EXTRACT_IMAGE,
+    EXTRACT_JOBS,
+    EXTRACT_SHARDS,
+    INGEST_WORKERS,
+    LAZY_INGEST,
+    INCREMENTAL_INGEST,
+    ASYNC_DB_WRITER,
+    COMPACT_FRAMES,
+    BULK_LOAD,
+    OUTPUT_SINKS,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -14,15 +43,107 @@ class DockerCLI(cmd.Cmd):
 
     def __init__(self):
         super().__init__()
-        self.docker_client = docker.from_env()
+        self._docker_client = None
+
+    @property
+    def docker_client(self):
+        # connect on first use so the local backend and ingest work without Docker
+        if self._docker_client is None:
+            self._docker_client = docker.from_env()
+        return self._docker_client
 
     def do_extract(self, arg):
-        'Extract tables specified instide /_1_dima_extract/export.sh into /extracted'
+        'Extract tables specified inside /_1_dima_extract/extract.sh into /extracted: extract [shards] [--local] [--parquet] (defaults from config.py)'
 
-        dockerfile_directory = DOCKERFILE_DIR
-        image_tag = "test:latest"
         output_directory = DATA_DIR
 
+        args = arg.split()
+        backend = EXTRACT_BACKEND
+        if "--local" in args:
+            args.remove("--local")
+            backend = "local"
+        output_format = EXTRACT_FORMAT
+        if "--parquet" in args:
+            args.remove("--parquet")
+            output_format = "parquet"
+
+        try:
+            shards = int(args[0]) if args else EXTRACT_SHARDS
+        except ValueError:
+            print(f"Invalid shard count: {arg}")
+            return
+
+        mdb_files = []
+        if os.path.isdir(DIMA_DIR):
+            mdb_files = sorted(f for f in os.listdir(DIMA_DIR) if f.endswith(".mdb"))
+        if not mdb_files:
+            print(f"No .mdb files found in '{DIMA_DIR}'.")
+            return
+
+        self.prepare_output_directory(output_directory)
+
+        if backend == "local":
+            self.extract_local(output_directory, output_format)
+            return
+
+        containers = []
+        try:
+            image_tag = self.ensure_extractor_image()
+
+            # Spread the .mdb files round-robin across the shard containers
+            shards = max(1, min(shards, len(mdb_files)))
+            jobs_per_shard = max(1, EXTRACT_JOBS // shards)
+            for shard in range(shards):
+                shard_files = [f"/dimas/{f}" for f in mdb_files[shard::shards]]
+                print(f"Starting extract container {shard + 1}/{shards} for {len(shard_files)} files...")
+                containers.append(self.docker_client.containers.run(
+                    image_tag,
+                    command=["/usr/local/bin/extract.sh", *shard_files],
+                    detach=True,
+                    environment={"EXTRACT_JOBS": str(jobs_per_shard)},
+                    volumes={
+                        os.path.abspath(DIMA_DIR): {'bind': '/dimas', 'mode': 'ro'},
+                        os.path.abspath(output_directory): {'bind': '/extracted', 'mode': 'rw'},
+                    }
+                ))
+
+            # Waiting for every container to complete, then merge their results
+            exit_codes = []
+            for shard, container in enumerate(containers):
+                result = container.wait()
+                exit_codes.append(result['StatusCode'])
+                logs = container.logs().decode('utf-8')
+                print(f"Container {shard + 1}/{shards} finished with exit code {result['StatusCode']}")
+                print("Container logs:\n", logs)
+
+            failed = [shard + 1 for shard, code in enumerate(exit_codes) if code != 0]
+            if failed:
+                print(f"Extraction failed in container(s) {failed}, exit codes {exit_codes}")
+            else:
+                print(f"Extraction finished in {shards} container(s).")
+
+        except docker.errors.BuildError as e:
+            print(f"Build failed: {e}")
+        except docker.errors.APIError as e:
+            print(f"Docker API error: {e}")
+        finally:
+            # Ensure the containers are stopped and removed
+            for container in containers:
+                container.remove(force=True)
+            if containers:
+                print("Containers stopped and removed.")
+
+    def extract_local(self, output_directory, output_format):
+        'Run mdbtools on the host through a subprocess pool, skipping Docker'
+        try:
+            failed = extract_all(DIMA_DIR, output_directory, EXTRACT_JOBS, output_format)
+            if failed:
+                print(f"Extraction finished with {failed} failed table(s).")
+        except FileNotFoundError as e:
+            print(f"Local extraction unavailable: {e}")
+
+    def prepare_output_directory(self, output_directory):
+        'Create the extract output directory, offering to clear it when it is not empty'
         if not os.path.exists(output_directory):
             os.makedirs(output_directory)
         else:
@@ -44,51 +165,137 @@ class DockerCLI(cmd.Cmd):
                 else:
                     print("Proceeding without clearing the directory.")
 
+    def ensure_extractor_image(self):
+        'Return the extractor image tag, building the image only when Dockerfile/extract.sh changed'
+        digest = hashlib.sha256()
+        for name in ("Dockerfile", "extract.sh"):
+            with open(os.path.join(DOCKERFILE_DIR, name), "rb") as f:
+                digest.update(f.read())
+        image_tag = f"{EXTRACT_IMAGE}:{digest.hexdigest()[:12]}"
+
         try:
-            print("Building the Docker image...")
-            image, logs = self.docker_client.images.build(path=dockerfile_directory, tag=image_tag)
-            for log in logs:
-                if 'stream' in log:
-                    print(log['stream'].strip())
-
-            print(f"Image '{image_tag}' built successfully.")
-
-            print("Running the container...")
-            container = self.docker_client.containers.run(
-                image_tag,
-                detach=True,
-                volumes={
-                    os.path.abspath(output_directory): {'bind': '/extracted', 'mode': 'rw'}
-                }
-            )
-
-            # Waiting for the container to complete the process
-            result = container.wait()
-            print(f"Container finished with exit code {result['StatusCode']}")
-            logs = container.logs().decode('utf-8')
-            print("Container logs:\n", logs)
+            self.docker_client.images.get(image_tag)
+            print(f"Using cached image '{image_tag}'.")
+            return image_tag
+        except docker.errors.ImageNotFound:
+            pass
 
-        except docker.errors.BuildError as e:
-            print(f"Build failed: {e}")
-        except docker.errors.APIError as e:
-            print(f"Docker API error: {e}")
-        finally:
-            # Ensure the container is stopped and removed
-            container.remove(force=True)
-            print("Container stopped and removed.")
+        print("Building the Docker image...")
+        image, logs = self.docker_client.images.build(path=DOCKERFILE_DIR, tag=image_tag)
+        for log in logs:
+            if 'stream' in log:
+                print(log['stream'].strip())
+
+        print(f"Image '{image_tag}' built successfully.")
+        return image_tag
 
     def do_ingest(self, arg):
+        'Ingest new or changed extracted files (CSV, Parquet or Arrow IPC) into the database: ingest [workers] [--lazy] [--full] [--sinks=postgres,parquet] [source ...] (default INGEST_WORKERS and OUTPUT_SINKS in config.py, all sources)'
         data_dir = DATA_DIR
 
-        for file_name in os.listdir(data_dir):
-            file_path = os.path.join(data_dir, file_name)
+        args = arg.split()
+        lazy = LAZY_INGEST
+        if "--lazy" in args:
+            args.remove("--lazy")
+            lazy = True
+        incremental = INCREMENTAL_INGEST
+        if "--full" in args:
+            args.remove("--full")
+            incremental = False
+        sinks = OUTPUT_SINKS
+        for flag in [a for a in args if a.startswith("--sinks=")]:
+            args.remove(flag)
+            sinks = [name for name in flag.split("=", 1)[1].split(",") if name]
+        if not sinks or unknown_sinks(sinks):
+            print(f"Invalid output sinks: {','.join(sinks) or 'none given'} (available: {', '.join(SINKS)})")
+            return
+        workers = INGEST_WORKERS
+        if args and args[0].isdigit():
+            workers = int(args.pop(0))
+        sources = set(args)
 
-            # Check if the file is a CSV
-            if file_name.endswith(".csv"):
-                process_csv(file_name, file_path)
-            else:
-                logger.info(f"Skipping non-CSV file: {file_name}")
+        if lazy and COMPACT_FRAMES:
+            logger.info("COMPACT_FRAMES does not apply to lazy ingest: streamed tables are never held in memory")
+        pipeline_metrics.reset()
+        configure_sinks(sinks)
+        reset_validation_report()
+        if ASYNC_DB_WRITER and not lazy:
+            db_writer.start()
+        index_plan, dropped_indexes = None, {}
+        try:
+            csv_files = self.select_files(data_dir, sources, incremental, sink_names())
+
+            if BULK_LOAD and not incremental and csv_files and "postgres" in sink_names():
+                # indexes are built once after the load instead of maintained during COPY
+                index_plan = table_index_plan(csv_files)
+                dropped_indexes = prepare_bulk_load(index_plan)
+            elif "postgres" in sink_names():
+                # restore indexes an interrupted bulk load dropped
+                finish_bulk_load({})
+
+            # Lines-Plots -> pksource -> tables, in topological order
+            plan, source_files = build_plan(csv_files, data_dir)
+            run_plan(plan, source_files, workers, lazy)
+
+            report_held_tables()
+        finally:
+            # wait for queued loads and report failed tables
+            db_writer.close()
+            if index_plan is not None:
+                finish_bulk_load(index_plan, dropped_indexes)
+            log_validation_report()
+            # stage timings, rows and memory for this run (see METRICS_PATH for the raw records)
+            pipeline_metrics.log_summary()
+            # release the pooled connections and cached frames shared by this run
+            close_pool()
+            frame_cache.clear()
+            table_catalog.clear()
+            # held tables, pksources and join indexes do not outlive the run
+            clear_run_state()
+
+
+    def do_plan(self, arg):
+        'Print the ingest schedule without loading anything: plan [--full] [source ...]'
+        args = arg.split()
+        incremental = INCREMENTAL_INGEST
+        if "--full" in args:
+            args.remove("--full")
+            incremental = False
+
+        csv_files = self.select_files(DATA_DIR, set(args), incremental)
+        plan, _ = build_plan(csv_files, DATA_DIR)
+        print(format_plan(plan) or "Nothing to ingest.")
+
+    def select_files(self, data_dir, sources, incremental, sinks=OUTPUT_SINKS):
+        'Files an ingest run would load: one per table, limited to sources, new, changed or missing from a sink when incremental.'
+        all_files = os.listdir(data_dir)
+        # One file per table; a converted Parquet/IPC file replaces its CSV unless it is older
+        ingest_files = select_ingest_files(all_files, data_dir)
+        for file_name in set(all_files) - set(ingest_files):
+            logger.info(f"Skipping file: {file_name}")
+
+        csv_files = []
+        for file_name in ingest_files:
+            # Only re-process the requested source DIMAs
+            if sources and file_name.split("_", 1)[0] not in sources:
+                continue
+            csv_files.append(file_name)
+
+        ingest_manifest.load()
+        if incremental:
+            changed = ingest_manifest.changed_files(csv_files, data_dir, sinks)
+            # tables of a unit whose pksource changed get new PrimaryKeys, so they are reloaded too
+            csv_files = affected_files(changed, csv_files)
+        return csv_files
 
+    def do_convert(self, arg):
+        'Convert extracted CSVs once to a columnar format read memory-mapped by ingest: convert [parquet|ipc]'
+        output_format = arg.strip() or "parquet"
+        if output_format not in ("parquet", "ipc"):
+            print(f"Unknown format: {output_format}")
+            return
+        converted = convert_csv_files(DATA_DIR, output_format, INGEST_WORKERS)
+        print(f"Converted {converted} files to {output_format}.")
 
     def do_exit(self, arg):
         'Exit the CLI'